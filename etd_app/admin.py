@@ -27,6 +27,27 @@ class ThesisAdmin(admin.ModelAdmin):
     ingest.short_description = 'Ingest selected theses'
 
 
+class KeywordAdmin(admin.ModelAdmin):
+
+    list_display = ['text', 'authority', 'usage_count']
+    search_fields = ['text', 'search_text']
+    actions = ['merge_duplicates']
+
+    def merge_duplicates(self, request, queryset):
+        clusters = models.Keyword.merge_duplicates(queryset)
+        for cluster in clusters:
+            messages.info(request, 'Merged %s into "%s"' % (', '.join(['"%s"' % k.text for k in cluster[1:]]), cluster[0].text))
+        if not clusters:
+            messages.info(request, 'No near-duplicates found in the selected keywords.')
+    merge_duplicates.short_description = 'Merge near-duplicates in selected keywords'
+
+
+class FixityCheckAdmin(admin.ModelAdmin):
+
+    list_display = ['thesis', 'file_name', 'passed', 'checked']
+    list_filter = ['passed']
+
+
 admin.site.register(models.Department)
 admin.site.register(models.Degree)
 admin.site.register(models.Person)
@@ -34,5 +55,6 @@ admin.site.register(models.GradschoolChecklist)
 admin.site.register(models.Candidate)
 admin.site.register(models.CommitteeMember)
 admin.site.register(models.Language)
-admin.site.register(models.Keyword)
+admin.site.register(models.Keyword, KeywordAdmin)
 admin.site.register(models.Thesis, ThesisAdmin)
+admin.site.register(models.FixityCheck, FixityCheckAdmin)
@@ -0,0 +1,98 @@
+from __future__ import unicode_literals
+import hashlib
+import multiprocessing
+import time
+
+
+CHUNK_SIZE = 64 * 1024
+#bigger reads for re-checking stored files, where there's no upload to keep pace with
+FIXITY_BUFFER_SIZE = 1024 * 1024
+
+
+class DigestCalculator(object):
+    '''Calculates several digests of some data at once, as it's fed in a chunk at a time.'''
+
+    def __init__(self, algorithms=('sha1',)):
+        self._hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in algorithms]
+        self.size = 0
+
+    def update(self, chunk):
+        for algorithm, digest in self._hashes:
+            digest.update(chunk)
+        self.size += len(chunk)
+
+    def hexdigests(self):
+        return dict((algorithm, digest.hexdigest()) for algorithm, digest in self._hashes)
+
+
+def calculate_digests(f, algorithms=('sha1',), chunk_size=CHUNK_SIZE):
+    '''Hex digests of a file (eg. {'sha1': ..., 'md5': ...}), reading it once, one chunk at a time,
+    so big files aren't read into memory. The file is left at the beginning.'''
+    calculator = DigestCalculator(algorithms)
+    if hasattr(f, 'seek'):
+        f.seek(0)
+    if hasattr(f, 'chunks'):
+        chunks = f.chunks(chunk_size)
+    else:
+        chunks = iter(lambda: f.read(chunk_size), b'')
+    for chunk in chunks:
+        calculator.update(chunk)
+    if hasattr(f, 'seek'):
+        f.seek(0)
+    return calculator.hexdigests()
+
+
+class Throttle(object):
+    '''Sleeps as needed to keep reading under bytes_per_second (no limit if it's None/0).'''
+
+    def __init__(self, bytes_per_second=None, clock=time.time, sleep=time.sleep):
+        self.bytes_per_second = bytes_per_second
+        self._clock = clock
+        self._sleep = sleep
+        self._start = clock()
+        self._bytes = 0
+
+    def consumed(self, num_bytes):
+        if not self.bytes_per_second:
+            return
+        self._bytes += num_bytes
+        wait = self._bytes / float(self.bytes_per_second) - (self._clock() - self._start)
+        if wait > 0:
+            self._sleep(wait)
+
+
+def file_digest(path, algorithm='sha1', buffer_size=FIXITY_BUFFER_SIZE, bytes_per_second=None):
+    throttle = Throttle(bytes_per_second)
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb', buffering=0) as f:
+        for chunk in iter(lambda: f.read(buffer_size), b''):
+            digest.update(chunk)
+            throttle.consumed(len(chunk))
+    return digest.hexdigest()
+
+
+def _file_digest_result(args):
+    #runs in the worker processes - has to be a module-level function, so it can be pickled
+    path, bytes_per_second = args
+    try:
+        return path, file_digest(path, bytes_per_second=bytes_per_second), ''
+    except (IOError, OSError) as e:
+        return path, '', '%s' % e
+
+
+def file_digests(paths, workers=1, bytes_per_second=None):
+    '''Yields (path, sha1 hex digest, error message) for each file, hashing them in a pool of worker processes
+    if workers > 1 (in the order they finish). bytes_per_second limits the reading for all the workers together.'''
+    worker_rate = bytes_per_second / float(workers) if bytes_per_second else None
+    args = [(path, worker_rate) for path in paths]
+    if workers <= 1:
+        for arg in args:
+            yield _file_digest_result(arg)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(_file_digest_result, args):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
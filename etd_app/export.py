@@ -0,0 +1,81 @@
+from __future__ import unicode_literals
+import csv
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+from .models import Candidate
+
+
+#(column name, field lookup from Candidate)
+EXPORT_FIELDS = [
+        ('candidate_id', 'id'),
+        ('netid', 'person__netid'),
+        ('last_name', 'person__last_name'),
+        ('first_name', 'person__first_name'),
+        ('email', 'person__email'),
+        ('department', 'department__name'),
+        ('degree', 'degree__abbreviation'),
+        ('year', 'year'),
+        ('embargo_end_year', 'embargo_end_year'),
+        ('date_registered', 'date_registered'),
+        ('title', 'thesis__title'),
+        ('thesis_status', 'thesis__status'),
+        ('date_submitted', 'thesis__date_submitted'),
+        ('date_accepted', 'thesis__date_accepted'),
+        ('date_rejected', 'thesis__date_rejected'),
+        ('pid', 'thesis__pid'),
+        ('dissertation_fee', 'gradschool_checklist__dissertation_fee'),
+        ('bursar_receipt', 'gradschool_checklist__bursar_receipt'),
+        ('gradschool_exit_survey', 'gradschool_checklist__gradschool_exit_survey'),
+        ('earned_docs_survey', 'gradschool_checklist__earned_docs_survey'),
+        ('pages_submitted_to_gradschool', 'gradschool_checklist__pages_submitted_to_gradschool'),
+    ]
+EXPORT_COLUMNS = [column for column, lookup in EXPORT_FIELDS]
+
+
+def get_export_rows(status, sort_param=None):
+    '''Iterate over tuples of the EXPORT_FIELDS values for the candidates with this status. Only the
+    exported values are selected, and the rows are streamed from the db instead of all loaded at once.'''
+    candidates = Candidate.get_candidates_by_status(status, sort_param)
+    return candidates.values_list(*[lookup for column, lookup in EXPORT_FIELDS]).iterator()
+
+
+class _Echo(object):
+    '''file-like object that just hands back what's written, so csv.writer can format one row at a time'''
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    if isinstance(value, six.text_type) and six.PY2:
+        return value.encode('utf8') #python 2 csv module doesn't handle unicode
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def json_lines(rows):
+    #one json array, written out an object at a time
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder, sort_keys=True)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+EXPORT_FORMATS = {
+        'csv': (csv_lines, 'text/csv'),
+        'json': (json_lines, 'application/json'),
+    }
@@ -0,0 +1,404 @@
+from __future__ import unicode_literals
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from xml.etree import cElementTree
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULT_CACHE_TTL = 60 * 60 * 24
+DEFAULT_CACHE_MAX_ENTRIES = 5000
+DEFAULT_LOOKUP_TIMEOUT = 2
+DEFAULT_LOOKUP_INDEXES = ('suggestall',)
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_RECOVERY_TIMEOUT = 30
+
+
+class FastLookupError(Exception):
+    pass
+
+class FastCircuitOpen(FastLookupError):
+    pass
+
+
+def normalize_term(term):
+    #so 'Clim', 'clim ', & composed/decomposed versions of a term all share a cache entry
+    return ' '.join(unicodedata.normalize('NFD', term).lower().split())
+
+
+def get_lookup_indexes():
+    #the FAST indexes that autocomplete searches (eg. 'suggestall', 'suggest50' for topical headings)
+    return getattr(settings, 'FAST_LOOKUP_INDEXES', DEFAULT_LOOKUP_INDEXES)
+
+
+class FastResultsCache(object):
+    '''Cache of FAST lookup results, keyed on the normalized search term & FAST index.
+    By default, entries are kept in memory for this process, up to max_entries (least-recently-used
+    entries are dropped first). If a django cache alias is given, that cache is used instead, so
+    the entries can be shared between processes.
+
+    With a django cache, lock=True also makes it a lock between processes: only the process that
+    gets the lock for a term looks it up, and the others wait for its results to show up in the cache.'''
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_entries=DEFAULT_CACHE_MAX_ENTRIES, backend=None, lock=False, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = caches[backend] if backend else None
+        self.use_lock = bool(lock and self.backend)
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_key(self, term, index):
+        key = '%s|%s' % (index, normalize_term(term))
+        if self.backend:
+            #memcached doesn't allow spaces or long keys
+            return 'etd_fast_%s' % hashlib.md5(key.encode('utf8')).hexdigest()
+        return key
+
+    def get(self, term, index):
+        '''Returns the cached results, or None if there aren't any (or they've expired).'''
+        key = self._get_key(term, index)
+        if self.backend:
+            return self.backend.get(key)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, results = entry
+            if expires < self._clock():
+                return None
+            self._entries[key] = entry #move to the end, as most recently used
+            return results
+
+    def set(self, term, index, results):
+        key = self._get_key(term, index)
+        if self.backend:
+            self.backend.set(key, results, self.ttl)
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + self.ttl, results)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        if self.backend:
+            self.backend.clear()
+        with self._lock:
+            self._entries.clear()
+
+    def acquire_lock(self, term, index, timeout):
+        '''True if we got the lock for this lookup (or aren't using locks). The lock expires after the
+        timeout, in case the process holding it dies.'''
+        if not self.use_lock:
+            return True
+        return self.backend.add('%s_lock' % self._get_key(term, index), 1, int(timeout) + 1)
+
+    def release_lock(self, term, index):
+        if self.use_lock:
+            self.backend.delete('%s_lock' % self._get_key(term, index))
+
+    def wait_for_results(self, term, index, timeout, interval=0.05):
+        '''Wait for another process to cache the results - returns None if they don't show up
+        before the timeout, or if the other process releases the lock without caching anything.'''
+        lock_key = '%s_lock' % self._get_key(term, index)
+        deadline = self._clock() + timeout
+        while True:
+            results = self.get(term, index)
+            if results is not None or self._clock() >= deadline or self.backend.get(lock_key) is None:
+                return results
+            time.sleep(interval)
+
+
+_results_cache = None
+_results_cache_config = None
+_results_cache_lock = threading.Lock()
+
+
+def get_results_cache():
+    '''The shared FastResultsCache, configured by the FAST_CACHE_TTL, FAST_CACHE_MAX_ENTRIES,
+    FAST_CACHE_BACKEND (a django cache alias), and FAST_CACHE_LOCK settings.'''
+    global _results_cache, _results_cache_config
+    config = (getattr(settings, 'FAST_CACHE_TTL', DEFAULT_CACHE_TTL),
+              getattr(settings, 'FAST_CACHE_MAX_ENTRIES', DEFAULT_CACHE_MAX_ENTRIES),
+              getattr(settings, 'FAST_CACHE_BACKEND', None),
+              getattr(settings, 'FAST_CACHE_LOCK', False))
+    with _results_cache_lock:
+        if _results_cache is None or config != _results_cache_config:
+            _results_cache = FastResultsCache(ttl=config[0], max_entries=config[1], backend=config[2], lock=config[3])
+            _results_cache_config = config
+        return _results_cache
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''Makes sure only one call for a key runs at a time in this process - other threads that ask for
+    the same key while it's running wait for that call, and get its result (or exception).'''
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+        if not is_leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    return _single_flight
+
+
+class FastClient(object):
+    '''HTTP client for FAST lookups. It keeps a pool of open connections to FAST, to reuse between requests.
+
+    It's also a circuit breaker: after failure_threshold failures in a row, the circuit opens, and
+    calls fail right away with FastCircuitOpen instead of waiting on FAST. Once recovery_timeout seconds
+    have passed, the next call starts a probe request in the background - if that succeeds, the circuit
+    closes again; if not, we wait another recovery_timeout before trying again.'''
+
+    def __init__(self, failure_threshold=DEFAULT_CIRCUIT_FAILURE_THRESHOLD, recovery_timeout=DEFAULT_CIRCUIT_RECOVERY_TIMEOUT,
+            pool_size=DEFAULT_POOL_SIZE, session=None, clock=time.time):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probe_thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+    def _request(self, url, timeout):
+        try:
+            response = self.session.get(url, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            self._record_failure()
+            raise FastLookupError('%s: %s' % (e.__class__.__name__, e))
+        self._record_success()
+        return data
+
+    def _probe(self, url, timeout):
+        try:
+            self._request(url, timeout)
+        except FastLookupError:
+            pass
+
+    def _start_probe(self, url, timeout):
+        '''Start a probe if it's time for one - returns False if the circuit has closed in the meantime.'''
+        with self._lock:
+            #a probe may have succeeded since we checked is_open
+            if self._opened_at is None:
+                return False
+            if self._clock() - self._opened_at < self.recovery_timeout:
+                return True
+            if self._probe_thread and self._probe_thread.is_alive():
+                return True
+            self._probe_thread = threading.Thread(target=self._probe, args=(url, timeout))
+            self._probe_thread.daemon = True
+            self._probe_thread.start()
+            return True
+
+    def get_json(self, url, timeout=DEFAULT_LOOKUP_TIMEOUT):
+        '''GET the url & return the parsed JSON. Raises FastCircuitOpen if FAST is being skipped, or
+        FastLookupError if the request fails.'''
+        if self.is_open and self._start_probe(url, timeout):
+            raise FastCircuitOpen('FAST circuit open after %s failures' % self._failures)
+        return self._request(url, timeout)
+
+
+_client = None
+_client_config = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    '''The shared FastClient, configured by the FAST_POOL_SIZE, FAST_CIRCUIT_FAILURE_THRESHOLD, and
+    FAST_CIRCUIT_RECOVERY_TIMEOUT settings.'''
+    global _client, _client_config
+    config = (getattr(settings, 'FAST_CIRCUIT_FAILURE_THRESHOLD', DEFAULT_CIRCUIT_FAILURE_THRESHOLD),
+              getattr(settings, 'FAST_CIRCUIT_RECOVERY_TIMEOUT', DEFAULT_CIRCUIT_RECOVERY_TIMEOUT),
+              getattr(settings, 'FAST_POOL_SIZE', DEFAULT_POOL_SIZE))
+    with _client_lock:
+        if _client is None or config != _client_config:
+            _client = FastClient(failure_threshold=config[0], recovery_timeout=config[1], pool_size=config[2])
+            _client_config = config
+        return _client
+
+
+def reset_client():
+    global _client
+    with _client_lock:
+        _client = None
+
+
+#parsing FAST dump files, for loading the FastSubject table - each parser streams the file,
+#  yielding (fast_id, heading, [alternate labels]) for each heading
+
+MARC_SUBDIVISION_CODES = 'vxyz'
+
+
+def _fast_id_from_uri(uri):
+    #http://id.worldcat.org/fast/1084736 -> fst01084736
+    return 'fst%08d' % int(uri.rstrip('/').rsplit('/', 1)[1])
+
+
+def _marc_heading(field):
+    #subfields are joined with spaces, except for subdivisions, which get '--'
+    heading = ''
+    for subfield in field:
+        code = subfield.get('code')
+        text = (subfield.text or '').strip()
+        if not text or not code or code.isdigit():
+            continue
+        if heading and code in MARC_SUBDIVISION_CODES:
+            heading = '%s--%s' % (heading, text)
+        elif heading:
+            heading = '%s %s' % (heading, text)
+        else:
+            heading = text
+    return heading
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_marcxml_subjects(f):
+    '''FAST authority records in MARCXML: the id is in the 001, the heading in a 1XX field, &
+    the alternate labels in 4XX fields.'''
+    root = None
+    #(python 2 cElementTree needs the event names as byte strings)
+    for event, element in cElementTree.iterparse(f, events=(str('start'), str('end'))):
+        if root is None:
+            root = element
+        if event != 'end' or _local_name(element.tag) != 'record':
+            continue
+        fast_id = None
+        heading = None
+        alt_labels = []
+        for field in element:
+            tag = field.get('tag', '')
+            name = _local_name(field.tag)
+            if name == 'controlfield' and tag == '001':
+                fast_id = (field.text or '').strip()
+            elif name == 'datafield' and tag.startswith('1') and heading is None:
+                heading = _marc_heading(field)
+            elif name == 'datafield' and tag.startswith('4'):
+                label = _marc_heading(field)
+                if label:
+                    alt_labels.append(label)
+        if fast_id and heading:
+            yield fast_id, heading, alt_labels
+        #drop the finished records from the tree, so we don't keep the whole file in memory
+        element.clear()
+        root.clear()
+
+
+NTRIPLE_LITERAL = re.compile(r'^<([^>]+)>\s+<([^>]+)>\s+"((?:[^"\\]|\\.)*)"(?:@[\w-]+|\^\^<[^>]+>)?\s*\.\s*$')
+NTRIPLE_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)')
+NTRIPLE_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+SKOS_PREF_LABEL = 'http://www.w3.org/2004/02/skos/core#prefLabel'
+SKOS_ALT_LABEL = 'http://www.w3.org/2004/02/skos/core#altLabel'
+
+
+def _unescape_ntriple(match):
+    escape = match.group(1)
+    if escape[0] in 'uU':
+        code_point = int(escape[1:], 16)
+        try:
+            return unichr(code_point)
+        except ValueError:
+            #narrow python build - use a surrogate pair
+            return ('\\U%08x' % code_point).decode('unicode-escape')
+    return NTRIPLE_ESCAPES.get(escape, escape)
+
+
+def iter_ntriples_subjects(f):
+    '''FAST linked data in N-Triples, with skos:prefLabel & skos:altLabel triples. The triples for
+    each heading need to be together in the file (as they are in the FAST dumps).'''
+    current_uri = None
+    heading = None
+    alt_labels = []
+    for line in f:
+        if isinstance(line, bytes):
+            line = line.decode('utf8')
+        match = NTRIPLE_LITERAL.match(line)
+        if not match or match.group(2) not in (SKOS_PREF_LABEL, SKOS_ALT_LABEL):
+            continue
+        uri, predicate, value = match.groups()
+        if uri != current_uri:
+            if heading:
+                yield _fast_id_from_uri(current_uri), heading, alt_labels
+            current_uri = uri
+            heading = None
+            alt_labels = []
+        value = NTRIPLE_ESCAPE.sub(_unescape_ntriple, value)
+        if predicate == SKOS_PREF_LABEL:
+            heading = value
+        else:
+            alt_labels.append(value)
+    if heading:
+        yield _fast_id_from_uri(current_uri), heading, alt_labels
+
+
+SUBJECT_FILE_FORMATS = {
+    'marcxml': iter_marcxml_subjects,
+    'nt': iter_ntriples_subjects,
+}
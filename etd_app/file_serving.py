@@ -0,0 +1,192 @@
+from __future__ import unicode_literals
+import calendar
+import os
+import urllib
+import uuid
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from .checksums import CHUNK_SIZE
+
+
+#How thesis files get sent to the browser, chosen by the THESIS_FILE_SERVING setting. For 'nginx' & 'apache',
+#  django just checks the request & sets the headers, and the web server sends the file itself (nginx needs
+#  an internal location for THESIS_ACCEL_REDIRECT_PREFIX that points at the storage location (MEDIA_ROOT by default);
+#  apache needs mod_xsendfile).
+
+DEFAULT_ACCEL_REDIRECT_PREFIX = '/protected_media/'
+#more ranges than this (after merging overlapping ones) in one request, & we just send the whole file
+MAX_RANGES = 50
+
+
+def _get_full_path(file_name, storage=None):
+    #resolve the name the same way the storage the file was saved in does
+    return (storage or default_storage).path(file_name)
+
+
+def parse_range_header(header, size):
+    '''The (first byte, last byte) ranges from a Range header, sorted & with overlapping ranges merged.
+    Returns None if the header is invalid (so it should be ignored), or [] if no range is satisfiable.'''
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        start, end = spec.split('-', 1)
+        try:
+            if not start:
+                #suffix range: the last N bytes
+                start = max(size - int(end), 0)
+                end = size - 1
+            else:
+                start = int(start)
+                if not end:
+                    end = max(start, size - 1)
+                elif int(end) < start:
+                    return None
+                else:
+                    end = int(end)
+        except ValueError:
+            return None
+        if start < size and size > 0:
+            ranges.append((start, min(end, size - 1)))
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _iter_range(f, start, end):
+    f.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = f.read(min(CHUNK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def _iter_multipart_ranges(f, parts, boundary):
+    try:
+        for part_header, (start, end) in parts:
+            yield part_header
+            for data in _iter_range(f, start, end):
+                yield data
+            yield b'\r\n'
+        yield ('--%s--\r\n' % boundary).encode('ascii')
+    finally:
+        f.close()
+
+
+def _iter_single_range(f, start, end):
+    try:
+        for data in _iter_range(f, start, end):
+            yield data
+    finally:
+        f.close()
+
+
+def _range_requested(request, etag, last_modified):
+    #with If-Range, only send part of the file if it hasn't changed - otherwise send the whole thing
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return etag is not None and parse_etags(if_range) == [etag]
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and last_modified is not None and _timestamp(last_modified) == if_range_date
+
+
+def serve_direct(request, file_name, content_type, etag=None, last_modified=None, storage=None):
+    full_path = _get_full_path(file_name, storage)
+    size = os.path.getsize(full_path)
+    ranges = None
+    if request.META.get('HTTP_RANGE') and _range_requested(request, etag, last_modified):
+        ranges = parse_range_header(request.META['HTTP_RANGE'], size)
+        if ranges is not None and len(ranges) > MAX_RANGES:
+            ranges = None
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%s' % size
+        return response
+    if not ranges:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_iter_single_range(open(full_path, 'rb'), start, end), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+        response['Content-Length'] = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for start, end in ranges:
+            part_header = '--%s\r\nContent-Type: %s\r\nContent-Range: bytes %s-%s/%s\r\n\r\n' % (boundary, content_type, start, end, size)
+            parts.append((part_header.encode('ascii'), (start, end)))
+        content_length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in parts) + len('--%s--\r\n' % boundary)
+        response = StreamingHttpResponse(_iter_multipart_ranges(open(full_path, 'rb'), parts, boundary), status=206,
+                content_type='multipart/byteranges; boundary=%s' % boundary)
+        response['Content-Length'] = content_length
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_nginx(request, file_name, content_type, etag=None, last_modified=None, storage=None):
+    response = HttpResponse(content_type=content_type)
+    prefix = getattr(settings, 'THESIS_ACCEL_REDIRECT_PREFIX', DEFAULT_ACCEL_REDIRECT_PREFIX)
+    response['X-Accel-Redirect'] = '%s%s' % (prefix, urllib.quote(file_name.encode('utf8')))
+    return response
+
+
+def serve_apache(request, file_name, content_type, etag=None, last_modified=None, storage=None):
+    response = HttpResponse(content_type=content_type)
+    response['X-Sendfile'] = _get_full_path(file_name, storage).encode('utf8')
+    return response
+
+
+FILE_SERVING_BACKENDS = {
+        'direct': serve_direct,
+        'nginx': serve_nginx,
+        'apache': serve_apache,
+    }
+
+
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        #If-Modified-Since is ignored when there's an If-None-Match
+        etags = parse_etags(if_none_match)
+        return etag is not None and (etag in etags or '*' in etags)
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return last_modified is not None and if_modified_since is not None and _timestamp(last_modified) <= if_modified_since
+
+
+def serve_file(request, file_name, content_type, download_name, etag=None, last_modified=None, storage=None):
+    '''Response for a file in storage (default_storage if it's not given), as an attachment called download_name.
+    With an etag (eg. the file checksum) or last_modified datetime, conditional requests can get a 304 Not Modified.'''
+    backend = getattr(settings, 'THESIS_FILE_SERVING', 'direct')
+    if backend not in FILE_SERVING_BACKENDS:
+        raise ImproperlyConfigured('THESIS_FILE_SERVING must be one of: %s' % ', '.join(sorted(FILE_SERVING_BACKENDS)))
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        response = FILE_SERVING_BACKENDS[backend](request, file_name, content_type, etag=etag, last_modified=last_modified,
+                storage=storage)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % download_name
+    if etag:
+        response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    return response
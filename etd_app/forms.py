@@ -108,6 +108,10 @@ class CandidateForm(forms.ModelForm):
 def pdf_validator(field_file):
     if not field_file.name.endswith('.pdf'):
         raise ValidationError('file must be a PDF')
+    #set by the ThesisUploadHandler, if it found a problem while the file was uploading
+    upload_error = getattr(field_file, 'upload_error', None)
+    if upload_error:
+        raise ValidationError(upload_error)
 
 
 class UploadForm(forms.Form):
@@ -123,7 +127,12 @@ class UploadForm(forms.Form):
             candidate.save()
 
     def __init__(self, *args, **kwargs):
+        #if the ThesisUploadHandler stopped the upload, there's no file, so report why instead of 'required'
+        upload_error = kwargs.pop('upload_error', None)
         super(UploadForm, self).__init__(*args, **kwargs)
+        if upload_error:
+            field = self.fields['thesis_file']
+            field.error_messages = dict(field.error_messages, required=upload_error)
         self.helper = FormHelper()
         self.helper.add_input(Submit('submit', 'Upload File'))
 
@@ -152,6 +161,15 @@ class MetadataForm(forms.ModelForm):
         self.helper.form_action="candidate_metadata"
         self.helper.add_input(Submit('submit', 'Save Metadata'))
 
+    def save(self, commit=True):
+        #the default m2m save clears the keywords & adds them all back - just save the changes instead
+        thesis = super(MetadataForm, self).save(commit=False)
+        self.save_m2m = lambda: thesis.update_keywords(self.cleaned_data['keywords'])
+        if commit:
+            thesis.save()
+            self.save_m2m()
+        return thesis
+
 
 class GradschoolChecklistForm(forms.Form):
 
@@ -1,5 +1,4 @@
 import json
-import os
 import requests
 from django.conf import settings
 from .models import Thesis
@@ -40,7 +39,7 @@ class ThesisIngester(object):
         return json.dumps({'xml_data': MODS_XML})
 
     def get_content_param(self):
-        return json.dumps([{'file_name': '%s' % self.thesis.current_file_name}])
+        return json.dumps([{'file_name': '%s' % self.thesis.original_file_name}])
 
     def get_ingest_params(self):
         params = {}
@@ -53,9 +52,10 @@ class ThesisIngester(object):
         return params
 
     def post_to_api(self, params):
-        with open(os.path.join(settings.MEDIA_ROOT, self.thesis.current_file_name), 'rb') as f:
+        #the file is stored under its checksum, but it goes to the repository with the name it was uploaded with
+        with open(self.thesis.file_path, 'rb') as f:
             try:
-                r = requests.post(self.api_url, data=params, files={self.thesis.current_file_name: f})
+                r = requests.post(self.api_url, data=params, files={self.thesis.original_file_name: f})
             except Exception as e:
                 raise IngestException('%s' % e)
         if r.ok:
@@ -0,0 +1,160 @@
+from __future__ import unicode_literals
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from django.conf import settings
+
+
+DEFAULT_MAX_AGE = 60 * 5
+DEFAULT_LIMIT = 20
+
+
+class KeywordIndex(object):
+    '''In-memory index of keywords for autocomplete. A search term matches a keyword if it's the start
+    of any word in the keyword's search_text (the lower-case, no-accent version of the text).
+
+    Every word-start suffix of each search_text goes in a sorted list, so all the keywords with a
+    word starting with the term are in one contiguous run of the list, found with a binary search.
+    The usage count of each keyword is kept too, for ranking the results.'''
+
+    def __init__(self, rows=()):
+        #rows are (id, text, search_text, usage_count)
+        self._keywords = {}
+        self._suffixes = []
+        self._lock = threading.Lock()
+        for keyword_id, text, search_text, usage_count in rows:
+            self._keywords[keyword_id] = (text, search_text, usage_count)
+            self._suffixes.extend(self._get_suffixes(keyword_id, search_text))
+        self._suffixes.sort()
+
+    def __len__(self):
+        return len(self._keywords)
+
+    @staticmethod
+    def _get_suffixes(keyword_id, search_text):
+        words = search_text.split()
+        return [(' '.join(words[i:]), keyword_id) for i in range(len(words))]
+
+    def add(self, keyword_id, text, search_text, usage_count=0):
+        with self._lock:
+            self._remove(keyword_id)
+            self._keywords[keyword_id] = (text, search_text, usage_count)
+            for suffix in self._get_suffixes(keyword_id, search_text):
+                insort(self._suffixes, suffix)
+
+    def remove(self, keyword_id):
+        with self._lock:
+            self._remove(keyword_id)
+
+    def set_usage_count(self, keyword_id, usage_count):
+        with self._lock:
+            if keyword_id in self._keywords:
+                text, search_text, old_count = self._keywords[keyword_id]
+                self._keywords[keyword_id] = (text, search_text, usage_count)
+
+    def _remove(self, keyword_id):
+        if keyword_id not in self._keywords:
+            return
+        text, search_text, usage_count = self._keywords.pop(keyword_id)
+        for suffix in self._get_suffixes(keyword_id, search_text):
+            position = bisect_left(self._suffixes, suffix)
+            if position < len(self._suffixes) and self._suffixes[position] == suffix:
+                del self._suffixes[position]
+
+    def search(self, search_term, limit=DEFAULT_LIMIT):
+        '''search_term should already be normalized with Keyword.get_search_text(). Returns up to limit
+        (id, text) pairs: exact matches first, then keywords that start with the term, then keywords
+        with a later word that starts with it - the most-used (then shortest) keywords first within each group.'''
+        search_term = ' '.join(search_term.split())
+        if not search_term:
+            return []
+        with self._lock:
+            matches = {}
+            position = bisect_left(self._suffixes, (search_term,))
+            while position < len(self._suffixes) and self._suffixes[position][0].startswith(search_term):
+                keyword_id = self._suffixes[position][1]
+                text, search_text, usage_count = self._keywords[keyword_id]
+                if search_text == search_term:
+                    group = 0
+                elif search_text.startswith(search_term):
+                    group = 1
+                else:
+                    group = 2
+                matches[keyword_id] = (group, -usage_count, len(search_text), search_text, keyword_id, text)
+                position += 1
+        return [(match[4], match[5]) for match in heapq.nsmallest(limit, matches.values())]
+
+
+_index = None
+_index_loaded = 0
+_index_lock = threading.Lock()
+#while a stale index is being reloaded, the changes made in this process are kept here as (method, args),
+#  so they can be made to the new index too - None when there's no reload going on
+_pending_changes = None
+
+
+def _load_index():
+    from .models import Keyword
+    return KeywordIndex(Keyword.objects.values_list('id', 'text', 'search_text', 'usage_count').iterator())
+
+
+def get_index():
+    '''The keyword index for this process, loaded the first time it's needed. Saves & deletes in this
+    process update it right away, and it's reloaded after KEYWORD_INDEX_MAX_AGE seconds to pick up
+    changes from other processes. The reload happens in the thread that finds the index is stale,
+    without holding the lock, so other threads keep searching the old index until the new one is ready.'''
+    global _index, _index_loaded, _pending_changes
+    max_age = getattr(settings, 'KEYWORD_INDEX_MAX_AGE', DEFAULT_MAX_AGE)
+    with _index_lock:
+        if _index is None:
+            #nothing to search yet, so everyone waits for the first load
+            _index = _load_index()
+            _index_loaded = time.time()
+            return _index
+        if _pending_changes is not None or (time.time() - _index_loaded) <= max_age:
+            return _index
+        _pending_changes = []
+    new_index = None
+    try:
+        new_index = _load_index()
+    finally:
+        with _index_lock:
+            if new_index is not None:
+                for method, args in _pending_changes:
+                    getattr(new_index, method)(*args)
+                _index = new_index
+                _index_loaded = time.time()
+            _pending_changes = None
+    return new_index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def _index_changed(method, *args):
+    #only keep an index up-to-date if it's already been loaded
+    with _index_lock:
+        index = _index
+        if _pending_changes is not None:
+            _pending_changes.append((method, args))
+    if index is not None:
+        getattr(index, method)(*args)
+
+
+def keyword_saved(keyword):
+    _index_changed('add', keyword.id, keyword.text, keyword.search_text, keyword.usage_count)
+
+
+def keyword_deleted(keyword):
+    _index_changed('remove', keyword.id)
+
+
+def usage_counts_changed(keyword_ids):
+    if _index is not None and keyword_ids:
+        from .models import Keyword
+        for keyword_id, usage_count in Keyword.objects.filter(id__in=keyword_ids).values_list('id', 'usage_count'):
+            _index_changed('set_usage_count', keyword_id, usage_count)
@@ -0,0 +1,23 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.models import FixityCheck
+
+
+class Command(BaseCommand):
+    help = 'Check stored thesis files against their checksums, starting with the ones checked longest ago'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='only check this many theses')
+        parser.add_argument('--workers', type=int, default=1, help='number of processes hashing files')
+        parser.add_argument('--max-mb-per-second', type=float, default=None, help='limit the reading for all the workers together')
+
+    def handle(self, *args, **options):
+        bytes_per_second = None
+        if options['max_mb_per_second']:
+            bytes_per_second = options['max_mb_per_second'] * 1024 * 1024
+        results = FixityCheck.run(limit=options['limit'], workers=options['workers'], bytes_per_second=bytes_per_second)
+        failures = [result for result in results if not result.passed]
+        for failure in failures:
+            self.stderr.write('thesis %s: %s failed (expected %s, found %s) %s' % (failure.thesis_id, failure.file_name,
+                    failure.expected_checksum, failure.found_checksum or '-', failure.error))
+        self.stdout.write('checked %s theses: %s failed' % (len(results), len(failures)))
@@ -0,0 +1,18 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.uploads import delete_expired_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked upload sessions (& their partial files) that have been abandoned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expiry-hours', type=float, default=None,
+                help='delete sessions that haven\'t had a chunk for this many hours (default THESIS_UPLOAD_SESSION_EXPIRY)')
+
+    def handle(self, *args, **options):
+        expiry = None
+        if options['expiry_hours'] is not None:
+            expiry = options['expiry_hours'] * 60 * 60
+        num_sessions, num_files = delete_expired_upload_sessions(expiry)
+        self.stdout.write('deleted %s expired upload sessions, & %s stray files' % (num_sessions, num_files))
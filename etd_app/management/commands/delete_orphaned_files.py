@@ -0,0 +1,22 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.models import Thesis
+
+
+class Command(BaseCommand):
+    help = 'Find (and optionally delete) files in thesis storage that no thesis refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', default=False, help='delete the orphaned files, instead of just listing them')
+        parser.add_argument('--grace-hours', type=float, default=24, help='leave files modified in the last GRACE_HOURS hours (default 24)')
+        parser.add_argument('--workers', type=int, default=1, help='number of threads deleting files')
+
+    def handle(self, *args, **options):
+        grace_period = options['grace_hours'] * 60 * 60
+        if options['delete']:
+            names = Thesis.delete_orphaned_files(grace_period, workers=options['workers'])
+        else:
+            names = Thesis.find_orphaned_files(grace_period)
+        for name in names:
+            self.stdout.write(name)
+        self.stdout.write('%s orphaned files%s' % (len(names), ' deleted' if options['delete'] else ''))
@@ -0,0 +1,27 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from django.utils import six
+from etd_app.export import get_export_rows, EXPORT_FORMATS
+from etd_app.models import CandidateSummary
+
+
+class Command(BaseCommand):
+    help = 'Export candidates, their checklist dates, and thesis status as CSV or JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='all',
+                choices=['all'] + [status for status, display in CandidateSummary.WORKFLOW_STATUSES])
+        parser.add_argument('--format', default='csv', choices=sorted(EXPORT_FORMATS.keys()), dest='export_format')
+        parser.add_argument('--sort-by', default=None, help='same as the sort_by parameter on the review pages')
+        parser.add_argument('--output', default=None, help='file to write to (default is stdout)')
+
+    def handle(self, *args, **options):
+        lines_func = EXPORT_FORMATS[options['export_format']][0]
+        lines = lines_func(get_export_rows(options['status'], options['sort_by']))
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for line in lines:
+                    f.write(line.encode('utf8') if isinstance(line, six.text_type) else line)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,29 @@
+from __future__ import unicode_literals
+import io
+from django.core.management.base import BaseCommand, CommandError
+from etd_app.fast import SUBJECT_FILE_FORMATS
+from etd_app.models import FastSubject
+
+
+class Command(BaseCommand):
+    help = 'Load the FAST subject headings from a FAST dump file (replacing any that were loaded before)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='the FAST dump file')
+        parser.add_argument('--format', dest='file_format', choices=sorted(SUBJECT_FILE_FORMATS.keys()),
+                help='format of the file (default: guessed from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='number of rows to insert per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format']
+        if not file_format:
+            if path.endswith('.nt'):
+                file_format = 'nt'
+            elif path.endswith('.xml'):
+                file_format = 'marcxml'
+            else:
+                raise CommandError('can\'t tell the format of %s - use --format' % path)
+        with io.open(path, 'rb') as f:
+            count = FastSubject.load(SUBJECT_FILE_FORMATS[file_format](f), batch_size=options['batch_size'])
+        self.stdout.write('loaded %s FAST subjects' % count)
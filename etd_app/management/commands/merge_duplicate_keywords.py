@@ -0,0 +1,20 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.models import Keyword
+
+
+class Command(BaseCommand):
+    help = 'List (and with --merge, merge) keywords that only differ by case, accents, or punctuation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merge', action='store_true', default=False,
+                help='merge the keywords (merging can\'t be undone) - otherwise they\'re just listed')
+
+    def handle(self, *args, **options):
+        if options['merge']:
+            clusters = Keyword.merge_duplicates()
+        else:
+            clusters = Keyword.find_duplicates()
+        for cluster in clusters:
+            self.stdout.write('%s <- %s' % (cluster[0].text, ' | '.join([k.text for k in cluster[1:]])))
+        self.stdout.write('%s groups of duplicates%s' % (len(clusters), '' if options['merge'] else ' (not merged - use --merge to merge them)'))
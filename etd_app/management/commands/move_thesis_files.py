@@ -0,0 +1,16 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.models import Thesis
+
+
+class Command(BaseCommand):
+    help = 'Move thesis files into the content-addressed storage layout (eg. ab/cd/<checksum>.pdf)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False, help='just list the files that would be moved')
+
+    def handle(self, *args, **options):
+        moved = Thesis.move_files_to_content_addressed_storage(dry_run=options['dry_run'])
+        for old_name, new_name in moved:
+            self.stdout.write('%s -> %s' % (old_name, new_name))
+        self.stdout.write('%s files%s' % (len(moved), ' (not moved)' if options['dry_run'] else ' moved'))
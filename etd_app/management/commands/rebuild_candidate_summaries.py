@@ -0,0 +1,14 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.models import CandidateSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the candidate summaries used by the staff dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='number of summaries to insert per query')
+
+    def handle(self, *args, **options):
+        count = CandidateSummary.rebuild(batch_size=options['batch_size'])
+        self.stdout.write('rebuilt %s candidate summaries' % count)
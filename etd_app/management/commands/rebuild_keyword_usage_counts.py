@@ -0,0 +1,11 @@
+from __future__ import unicode_literals
+from django.core.management.base import BaseCommand
+from etd_app.models import Keyword
+
+
+class Command(BaseCommand):
+    help = 'Recalculate how many theses use each keyword (for ranking keyword suggestions)'
+
+    def handle(self, *args, **options):
+        Keyword.rebuild_usage_counts()
+        self.stdout.write('rebuilt keyword usage counts')
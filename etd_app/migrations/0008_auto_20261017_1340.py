@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0007_auto_20160804_1434'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidate',
+            name='date_registered',
+            field=models.DateField(default=datetime.date.today, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='last_name',
+            field=models.CharField(max_length=190, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='thesis',
+            name='date_submitted',
+            field=models.DateTimeField(db_index=True, null=True, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='thesis',
+            index_together=set([('status', 'date_submitted')]),
+        ),
+    ]
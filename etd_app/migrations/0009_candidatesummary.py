@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Q, Case, When, Value
+
+
+def create_summaries(apps, schema_editor):
+    #same logic as CandidateSummary.rebuild(), with the historical models
+    Candidate = apps.get_model('etd_app', 'Candidate')
+    CandidateSummary = apps.get_model('etd_app', 'CandidateSummary')
+    paperwork_complete = Q(gradschool_checklist__bursar_receipt__isnull=False,
+                           gradschool_checklist__pages_submitted_to_gradschool__isnull=False) & (
+                         Q(degree__degree_type='masters') |
+                         Q(gradschool_checklist__dissertation_fee__isnull=False,
+                           gradschool_checklist__gradschool_exit_survey__isnull=False,
+                           gradschool_checklist__earned_docs_survey__isnull=False))
+    workflow_status = Case(
+            When(thesis__status='not_submitted', then=Value('in_progress')),
+            When(thesis__status='pending', then=Value('awaiting_gradschool')),
+            When(thesis__status='rejected', then=Value('dissertation_rejected')),
+            When(Q(thesis__status='accepted') & paperwork_complete, then=Value('complete')),
+            When(thesis__status='accepted', then=Value('paperwork_incomplete')),
+            default=Value(''), output_field=models.CharField())
+    rows = Candidate.objects.filter(thesis__isnull=False).annotate(workflow_status=workflow_status).values_list(
+            'id', 'workflow_status', 'person__last_name', 'person__first_name', 'department__name',
+            'thesis__title', 'thesis__status', 'date_registered', 'thesis__date_submitted')
+    CandidateSummary.objects.bulk_create([
+            CandidateSummary(candidate_id=row[0], workflow_status=row[1], last_name=row[2], first_name=row[3],
+                department_name=row[4], title=row[5], thesis_status=row[6], date_registered=row[7], date_submitted=row[8])
+            for row in rows.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0008_auto_20261017_1340'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateSummary',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('workflow_status', models.CharField(blank=True, max_length=50, choices=[('in_progress', 'In progress (dissertation not yet submitted)'), ('awaiting_gradschool', 'Dissertation submitted, Grad school action needed'), ('dissertation_rejected', 'Dissertation rejected, awaiting resubmission'), ('paperwork_incomplete', 'Dissertation approved, paperwork incomplete'), ('complete', 'Dissertation approved, paperwork complete')])),
+                ('last_name', models.CharField(max_length=190)),
+                ('first_name', models.CharField(max_length=190)),
+                ('department_name', models.CharField(max_length=190)),
+                ('title', models.CharField(max_length=255)),
+                ('thesis_status', models.CharField(max_length=50, choices=[('not_submitted', 'Not Submitted'), ('pending', 'Awaiting Grad School Review'), ('accepted', 'Accepted'), ('rejected', 'Rejected'), ('ingested', 'Ingested'), ('ingest_error', 'Ingestion Error')])),
+                ('date_registered', models.DateField()),
+                ('date_submitted', models.DateTimeField(null=True, blank=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('candidate', models.OneToOneField(related_name='summary', to='etd_app.Candidate')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='candidatesummary',
+            index_together=set([('workflow_status', 'last_name')]),
+        ),
+        migrations.RunPython(create_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0009_candidatesummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='person',
+            name='first_name',
+            field=models.CharField(max_length=190, db_index=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0010_auto_20261017_1344'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FastSubject',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('fast_id', models.CharField(max_length=20, db_index=True)),
+                ('heading', models.CharField(max_length=190)),
+                ('label', models.CharField(max_length=190)),
+                ('search_text', models.CharField(max_length=190, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def set_usage_counts(apps, schema_editor):
+    #same logic as Keyword.rebuild_usage_counts(), with the historical models
+    Keyword = apps.get_model('etd_app', 'Keyword')
+    ids_by_count = {}
+    for keyword_id, count in Keyword.objects.annotate(count=Count('thesis')).values_list('id', 'count'):
+        if count:
+            ids_by_count.setdefault(count, []).append(keyword_id)
+    for count, ids in ids_by_count.items():
+        Keyword.objects.filter(id__in=ids).update(usage_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0011_fastsubject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keyword',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, db_index=True),
+        ),
+        migrations.RunPython(set_usage_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0012_keyword_usage_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thesis',
+            name='md5',
+            field=models.CharField(max_length=32, blank=True),
+        ),
+        migrations.AddField(
+            model_name='thesis',
+            name='sha256',
+            field=models.CharField(max_length=64, blank=True),
+        ),
+    ]
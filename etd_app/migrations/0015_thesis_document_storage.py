@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import etd_app.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0014_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='thesis',
+            name='document',
+            field=models.FileField(storage=etd_app.storage.ContentAddressedStorage(), upload_to=etd_app.storage.thesis_file_name),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0015_thesis_document_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FixityCheck',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('file_name', models.CharField(max_length=100)),
+                ('expected_checksum', models.CharField(max_length=100)),
+                ('found_checksum', models.CharField(max_length=100, blank=True)),
+                ('passed', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('checked', models.DateTimeField(db_index=True)),
+                ('thesis', models.ForeignKey(related_name='fixity_checks', to='etd_app.Thesis')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0016_fixitycheck'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidatesummary',
+            name='last_name',
+            field=models.CharField(max_length=190, db_index=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0017_candidatesummary_last_name_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidate',
+            name='date_registered',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='thesis',
+            name='date_submitted',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='candidatesummary',
+            index_together=set([('workflow_status', 'date_registered'), ('workflow_status', 'last_name'), ('workflow_status', 'thesis_status'), ('workflow_status', 'department_name'), ('workflow_status', 'date_submitted'), ('workflow_status', 'title')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='thesis',
+            index_together=set([]),
+        ),
+    ]
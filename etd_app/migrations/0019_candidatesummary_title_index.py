@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etd_app', '0018_candidatesummary_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidatesummary',
+            name='title',
+            field=models.CharField(max_length=255, db_index=True),
+        ),
+    ]
@@ -1,13 +1,23 @@
 from __future__ import unicode_literals
-import hashlib
 import os
+import re
+import tempfile
+import time
 import unicodedata
+import uuid
 from datetime import date
-from django.db import models, IntegrityError
-from django.db.models import Q
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, F, Case, When, Value, Count, Max
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.utils import timezone
 from model_utils import Choices
+from . import checksums
 from . import email
+from . import keyword_index
+from . import storage
 
 
 class DuplicateNetidException(Exception):
@@ -43,6 +53,10 @@ class Department(models.Model):
     def __unicode__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super(Department, self).save(*args, **kwargs)
+        CandidateSummary.objects.filter(candidate__department=self).update(department_name=self.name)
+
 
 class Degree(models.Model):
 
@@ -58,14 +72,22 @@ class Degree(models.Model):
     def __unicode__(self):
         return self.abbreviation
 
+    def save(self, *args, **kwargs):
+        super(Degree, self).save(*args, **kwargs)
+        #the degree type decides which paperwork an accepted thesis needs, so it can move candidates between workflow statuses
+        candidates = Candidate.objects.filter(degree=self, thesis__status=Thesis.STATUS_CHOICES.accepted).select_related(
+                'person', 'department', 'degree', 'thesis', 'gradschool_checklist')
+        for candidate in candidates:
+            CandidateSummary.update_for_candidate(candidate)
+
 
 class Person(models.Model):
 
     netid = models.CharField(max_length=100, null=True, unique=True, blank=True)
     orcid = models.CharField(max_length=100, null=True, unique=True, blank=True)
     bannerid = models.CharField(max_length=100, null=True, unique=True, blank=True)
-    last_name = models.CharField(max_length=190)
-    first_name = models.CharField(max_length=190)
+    last_name = models.CharField(max_length=190, db_index=True)
+    first_name = models.CharField(max_length=190, db_index=True)
     middle = models.CharField(max_length=100, blank=True)
     email = models.EmailField(max_length=190, null=True, unique=True, blank=True) #need length b/c of unique constraint & mysql issues
     created = models.DateTimeField(auto_now_add=True)
@@ -105,6 +127,8 @@ class Person(models.Model):
             self._check_for_duplicate_exception(msg)
             #... or just re-raise current exception if it didn't match
             raise
+        #keep the name in the candidate summaries up-to-date
+        CandidateSummary.objects.filter(candidate__person=self).update(last_name=self.last_name, first_name=self.first_name)
 
     def get_formatted_name(self):
         name = self.last_name
@@ -125,6 +149,12 @@ class GradschoolChecklist(models.Model):
     def __unicode__(self):
         return 'Gradschool Checklist'
 
+    def save(self, *args, **kwargs):
+        super(GradschoolChecklist, self).save(*args, **kwargs)
+        #a new candidate doesn't have a thesis yet - the summary gets created when the thesis is
+        if hasattr(self.candidate, 'thesis'):
+            CandidateSummary.update_for_candidate(self.candidate)
+
     def status(self):
         if self.complete():
             return 'Complete'
@@ -164,6 +194,11 @@ class Language(models.Model):
         return self.name
 
 
+#for Keyword.get_duplicate_key
+DUPLICATE_KEY_OUTER_PUNCTUATION = '.,;:!?\'"()[]{}'
+SINGLE_HYPHEN_RE = re.compile(r'(?<=\w)-(?=\w)', re.UNICODE)
+
+
 class Keyword(models.Model):
 
     text = models.CharField(max_length=190, unique=True)
@@ -171,18 +206,24 @@ class Keyword(models.Model):
     authority = models.CharField(max_length=100, blank=True)
     authority_uri = models.CharField(max_length=190, blank=True)
     value_uri = models.CharField(max_length=190, blank=True)
+    #number of theses using this keyword - kept up-to-date when thesis keywords change, & can be
+    #  rebuilt with the rebuild_keyword_usage_counts command
+    usage_count = models.PositiveIntegerField(default=0, db_index=True)
 
     def __unicode__(self):
         return self.text
 
     def save(self, *args, **kwargs):
+        self._clean_text()
+        super(Keyword, self).save(*args, **kwargs)
+
+    def _clean_text(self):
         if (self.text is None) or (len(self.text) == 0):
             raise KeywordException('no empty keywords allowed')
         self.text = Keyword.normalize_text(self.text)
         if len(self.text) > 190:
             raise KeywordException('keyword %s too long' % self.text.encode('utf8'))
         self.search_text = Keyword.get_search_text(self.text)
-        super(Keyword, self).save(*args, **kwargs)
 
     @staticmethod
     def normalize_text(text):
@@ -195,15 +236,215 @@ class Keyword(models.Model):
         return ''.join([c for c in nfd_normalized_text if unicodedata.category(c) != 'Mn']).lower()
 
     @staticmethod
-    def search(term, order=None):
+    def search(term, order=None, limit=None):
         term = Keyword.normalize_text(term)
         #this is search, so we're fine with getting fuzzy results
         #  so search the lower-case, no-accent version as well
         queryset = Keyword.objects.filter(Q(text__icontains=term) | Q(search_text__icontains=term))
         if order:
+            #eg. '-usage_count' for the most-used keywords first (usage_count is indexed)
             queryset = queryset.order_by(order)
+        if limit:
+            queryset = queryset[:limit]
         return list(queryset)
 
+    @staticmethod
+    def update_usage_counts(keyword_ids, change):
+        '''Add change to the usage count of each keyword in keyword_ids (a keyword can be listed more than once).'''
+        changes = {}
+        for keyword_id in keyword_ids:
+            changes[keyword_id] = changes.get(keyword_id, 0) + change
+        #one query for each distinct change, which is usually just one
+        ids_by_change = {}
+        for keyword_id, keyword_change in changes.items():
+            ids_by_change.setdefault(keyword_change, []).append(keyword_id)
+        for keyword_change, ids in ids_by_change.items():
+            #don't go below zero, if the counts have gotten out of sync
+            Keyword.objects.filter(id__in=ids, usage_count__gte=-keyword_change).update(usage_count=F('usage_count') + keyword_change)
+        keyword_index.usage_counts_changed(changes.keys())
+
+    @staticmethod
+    def rebuild_usage_counts():
+        '''Recalculate all the usage counts from the thesis keywords.'''
+        ids_by_count = {}
+        for keyword_id, count in Keyword.objects.annotate(count=Count('thesis')).values_list('id', 'count'):
+            ids_by_count.setdefault(count, []).append(keyword_id)
+        with transaction.atomic():
+            for count, ids in ids_by_count.items():
+                Keyword.objects.filter(id__in=ids).update(usage_count=count)
+        keyword_index.reset_index()
+
+    @staticmethod
+    def get_or_create_all(keywords):
+        '''Takes a list of unsaved Keywords, & returns the saved Keyword for each one, in the same order:
+        the existing keyword with the same text, or a new one. Uses a constant number of queries.'''
+        for keyword in keywords:
+            keyword._clean_text()
+        texts = set(keyword.text for keyword in keywords)
+        found = dict((keyword.text, keyword) for keyword in Keyword.objects.filter(text__in=texts))
+        to_create = []
+        texts_to_create = set()
+        for keyword in keywords:
+            if keyword.text not in found and keyword.text not in texts_to_create:
+                to_create.append(keyword)
+                texts_to_create.add(keyword.text)
+        if to_create:
+            try:
+                with transaction.atomic():
+                    Keyword.objects.bulk_create(to_create)
+            except IntegrityError:
+                #someone else added some of these keywords at the same time - create the rest one at a time
+                for keyword in to_create:
+                    try:
+                        with transaction.atomic():
+                            keyword.save()
+                    except IntegrityError:
+                        pass
+            #bulk_create doesn't set the ids (or send post_save), so get the new keywords from the db
+            for keyword in Keyword.objects.filter(text__in=texts_to_create):
+                found[keyword.text] = keyword
+                keyword_index.keyword_saved(keyword)
+        #the db may match text loosely (eg. mysql collations ignore case & accents), & return a different version
+        #  of the text - so fall back to the lower-case & no-accent versions, & finally to asking the db
+        found_lower = dict((text.lower(), keyword) for text, keyword in found.items())
+        found_search_text = dict((keyword.search_text, keyword) for keyword in found.values())
+        results = []
+        for keyword in keywords:
+            match = found.get(keyword.text) or found_lower.get(keyword.text.lower()) or found_search_text.get(keyword.search_text)
+            if match is None:
+                match = found[keyword.text] = Keyword.objects.get(text=keyword.text)
+            results.append(match)
+        return results
+
+    @staticmethod
+    def get_duplicate_key(search_text):
+        #keywords with the same key are probably the same: eg. 'Climate change', 'climate-change', 'Climate change.'
+        #  Only punctuation around words & single hyphens inside them are ignored, so 'C++', 'C#' & 'C' stay
+        #  different, & so do FAST subdivisions like 'Women--Employment'.
+        words = [word.strip(DUPLICATE_KEY_OUTER_PUNCTUATION) for word in SINGLE_HYPHEN_RE.sub(' ', search_text).split()]
+        return ' '.join([word for word in words if word])
+
+    @staticmethod
+    def find_duplicates(queryset=None):
+        '''Groups of near-duplicate keywords (by get_duplicate_key), as lists of Keywords with the
+        canonical keyword first: a FAST keyword if there is one, then the most-used, then the oldest.'''
+        if queryset is None:
+            queryset = Keyword.objects.all()
+        ids_by_key = {}
+        for keyword_id, search_text in queryset.values_list('id', 'search_text').iterator():
+            ids_by_key.setdefault(Keyword.get_duplicate_key(search_text), []).append(keyword_id)
+        duplicate_ids = [ids for ids in ids_by_key.values() if len(ids) > 1]
+        keywords = Keyword.objects.in_bulk([keyword_id for ids in duplicate_ids for keyword_id in ids])
+        clusters = []
+        for ids in duplicate_ids:
+            cluster = [keywords[keyword_id] for keyword_id in ids]
+            #different FAST headings are different subjects, even if their text is nearly the same
+            if len(set(k.value_uri for k in cluster if k.authority == 'fast')) > 1:
+                continue
+            cluster.sort(key=lambda k: (k.authority != 'fast', -k.usage_count, k.id))
+            clusters.append(cluster)
+        return sorted(clusters, key=lambda cluster: cluster[0].id)
+
+    @staticmethod
+    def merge(canonical, duplicates):
+        '''Move the theses using the duplicates over to the canonical keyword, & delete the duplicates.
+        The thesis-keyword links are changed in bulk, all in one transaction.'''
+        duplicate_ids = [keyword.id for keyword in duplicates if keyword.id != canonical.id]
+        if not duplicate_ids:
+            return
+        links = Thesis.keywords.through.objects
+        with transaction.atomic():
+            thesis_ids = set(links.filter(keyword_id__in=duplicate_ids).values_list('thesis_id', flat=True))
+            thesis_ids -= set(links.filter(keyword_id=canonical.id, thesis_id__in=thesis_ids).values_list('thesis_id', flat=True))
+            links.filter(keyword_id__in=duplicate_ids).delete()
+            links.bulk_create([Thesis.keywords.through(thesis_id=thesis_id, keyword_id=canonical.id) for thesis_id in thesis_ids])
+            Keyword.objects.filter(id=canonical.id).update(usage_count=links.filter(keyword_id=canonical.id).count())
+            Keyword.objects.filter(id__in=duplicate_ids).delete()
+        keyword_index.usage_counts_changed([canonical.id])
+
+    @staticmethod
+    def merge_duplicates(queryset=None):
+        '''Merge each group of near-duplicates into its canonical keyword. Returns the groups that were merged.'''
+        clusters = Keyword.find_duplicates(queryset)
+        for cluster in clusters:
+            Keyword.merge(cluster[0], cluster[1:])
+        return clusters
+
+    @staticmethod
+    def suggest(term, limit=keyword_index.DEFAULT_LIMIT):
+        '''Fast search for autocomplete, from the in-memory keyword index: returns up to limit
+        ranked (id, text) pairs for keywords with a word starting with term.'''
+        search_term = Keyword.get_search_text(Keyword.normalize_text(term))
+        return keyword_index.get_index().search(search_term, limit=limit)
+
+
+@receiver(post_save, sender=Keyword)
+def _keyword_saved(sender, instance, **kwargs):
+    keyword_index.keyword_saved(instance)
+
+
+@receiver(post_delete, sender=Keyword)
+def _keyword_deleted(sender, instance, **kwargs):
+    keyword_index.keyword_deleted(instance)
+
+
+class FastSubject(models.Model):
+    '''A local copy of the FAST subject headings, loaded from a FAST dump (see the import_fast_subjects
+    command), so autocomplete doesn't have to call FAST. There's a row for each label of a heading -
+    the heading itself, & each alternate label.'''
+
+    fast_id = models.CharField(max_length=20, db_index=True)
+    heading = models.CharField(max_length=190)
+    label = models.CharField(max_length=190)
+    search_text = models.CharField(max_length=190, db_index=True)
+
+    def __unicode__(self):
+        return self.label
+
+    @staticmethod
+    def load(subjects, batch_size=1000):
+        '''Replace all the FAST subjects with the (fast_id, heading, alternate labels) tuples from subjects,
+        inserting batch_size rows at a time. Labels that are too long for the Keyword table are skipped.
+        Returns the number of headings loaded.'''
+        count = 0
+        with transaction.atomic():
+            FastSubject.objects.all().delete()
+            rows = []
+            for fast_id, heading, alt_labels in subjects:
+                heading = Keyword.normalize_text(heading)
+                if len(heading) > 190:
+                    continue
+                count += 1
+                for label in [heading] + [Keyword.normalize_text(l) for l in alt_labels]:
+                    if len(label) <= 190:
+                        rows.append(FastSubject(fast_id=fast_id, heading=heading, label=label, search_text=Keyword.get_search_text(label)))
+                if len(rows) >= batch_size:
+                    FastSubject.objects.bulk_create(rows)
+                    rows = []
+            FastSubject.objects.bulk_create(rows)
+        return count
+
+    @staticmethod
+    def search(term, limit=20):
+        '''Headings with a label that starts with term, as (fast_id, heading, matching label) tuples.
+        Uses the search_text index, so it's a quick range scan.'''
+        search_term = Keyword.get_search_text(Keyword.normalize_text(term)).strip()
+        if not search_term:
+            return []
+        #search_text is lower-case already, but istartswith is a plain LIKE on mysql, which can use the index
+        #  (startswith is LIKE BINARY, which can't)
+        rows = FastSubject.objects.filter(search_text__istartswith=search_term).order_by('search_text').values_list('fast_id', 'heading', 'label')
+        results = []
+        fast_ids = []
+        #a heading can match on more than one label, so get extra rows to fill up the limit
+        for fast_id, heading, label in rows[:limit * 3]:
+            if fast_id not in fast_ids:
+                results.append((fast_id, heading, label))
+                fast_ids.append(fast_id)
+            if len(results) >= limit:
+                break
+        return results
+
 
 class FormatChecklist(models.Model):
 
@@ -245,9 +486,11 @@ class Thesis(models.Model):
         )
 
     candidate = models.OneToOneField('Candidate')
-    document = models.FileField()
+    document = models.FileField(storage=storage.ContentAddressedStorage(), upload_to=storage.thesis_file_name)
     original_file_name = models.CharField(max_length=190)
-    checksum = models.CharField(max_length=100)
+    checksum = models.CharField(max_length=100) #sha1
+    sha256 = models.CharField(max_length=64, blank=True)
+    md5 = models.CharField(max_length=32, blank=True)
     title = models.CharField(max_length=255)
     abstract = models.TextField()
     keywords = models.ManyToManyField(Keyword)
@@ -266,8 +509,17 @@ class Thesis(models.Model):
         verbose_name_plural = 'Theses'
 
     @staticmethod
-    def calculate_checksum(thesis_file):
-        return hashlib.sha1(thesis_file.read()).hexdigest()
+    def get_digest_algorithms():
+        #the sha1 checksum, plus any extra digests in the THESIS_EXTRA_DIGESTS setting
+        return ['sha1'] + list(getattr(settings, 'THESIS_EXTRA_DIGESTS', ['sha256', 'md5']))
+
+    def _set_checksums(self, digests=None):
+        #digests may have been calculated already, as the file was uploaded - otherwise, read the file once for all of them
+        if not digests:
+            digests = checksums.calculate_digests(self.document, Thesis.get_digest_algorithms())
+        self.checksum = digests['sha1']
+        self.sha256 = digests.get('sha256', '')
+        self.md5 = digests.get('md5', '')
 
     def __unicode__(self):
         return self.title
@@ -290,8 +542,9 @@ class Thesis(models.Model):
                 raise ThesisException('must be a pdf file')
             if not self.original_file_name:
                 self.original_file_name = os.path.basename(self.document.name) #grabbing name from tmp file, since we haven't saved yet
-            if not self.checksum:
-                self.checksum = Thesis.calculate_checksum(self.document)
+            #a new file needs its checksums before it's saved, since they give its name in storage
+            if not self.checksum or not self.document._committed:
+                self._set_checksums(getattr(self.document.file, 'digests', None))
         if not self.language:
             self.language = self._get_default_language()
         if self.abstract:
@@ -299,6 +552,7 @@ class Thesis(models.Model):
         super(Thesis, self).save(*args, **kwargs)
         if not hasattr(self, 'format_checklist'):
             self.format_checklist = FormatChecklist.objects.create(thesis=self)
+        CandidateSummary.update_for_candidate(self.candidate)
 
     @property
     def label(self):
@@ -311,12 +565,84 @@ class Thesis(models.Model):
     def current_file_name(self):
         return os.path.basename(self.document.name)
 
+    @property
+    def file_path(self):
+        #full path to the file in storage
+        return self.document.path
+
     def update_thesis_file(self, thesis_file):
         self.document = thesis_file
         self.original_file_name = thesis_file.name
-        self.checksum = Thesis.calculate_checksum(self.document)
         self.save()
 
+    @staticmethod
+    def move_files_to_content_addressed_storage(dry_run=False, batch_size=500):
+        '''Move thesis files that were stored by their uploaded name into the content-addressed layout,
+        updating the theses. Returns a list of (old name, new name) for the files that were (or would be) moved.'''
+        document_storage = Thesis._meta.get_field('document').storage
+        moved = []
+        updates = []
+        for thesis_id, name, checksum in Thesis.objects.exclude(document='').values_list('id', 'document', 'checksum'):
+            if not checksum:
+                if not document_storage.exists(name):
+                    continue
+                with document_storage.open(name) as f:
+                    checksum = checksums.calculate_digests(f)['sha1']
+            new_name = storage.content_addressed_name(checksum, os.path.splitext(name)[1])
+            if name == new_name or not (document_storage.exists(name) or document_storage.exists(new_name)):
+                continue
+            moved.append((name, new_name))
+            if dry_run:
+                continue
+            if not document_storage.exists(new_name):
+                new_dir = os.path.dirname(document_storage.path(new_name))
+                if not os.path.exists(new_dir):
+                    os.makedirs(new_dir)
+                os.rename(document_storage.path(name), document_storage.path(new_name))
+            updates.append((thesis_id, new_name, checksum))
+        #update the theses in batches, with one UPDATE for each batch
+        for i in range(0, len(updates), batch_size):
+            batch = updates[i:i + batch_size]
+            Thesis.objects.filter(id__in=[thesis_id for thesis_id, new_name, checksum in batch]).update(
+                    document=Case(*[When(id=thesis_id, then=Value(new_name)) for thesis_id, new_name, checksum in batch]),
+                    checksum=Case(*[When(id=thesis_id, then=Value(checksum)) for thesis_id, new_name, checksum in batch]))
+        if not dry_run:
+            #identical files are only kept once - any other copies can go, once nothing refers to them
+            current_names = set(Thesis.objects.values_list('document', flat=True))
+            for old_name, new_name in moved:
+                if old_name not in current_names and document_storage.exists(old_name):
+                    document_storage.delete(old_name)
+        return moved
+
+    @staticmethod
+    def find_orphaned_files(grace_period=storage.DEFAULT_ORPHAN_GRACE_PERIOD):
+        '''Names of files in thesis storage that no thesis refers to (eg. files that were replaced by a new upload),
+        and that haven't been modified for grace_period seconds.'''
+        document_storage = Thesis._meta.get_field('document').storage
+        stored_files = storage.list_files(document_storage.location, exclude_dirs=[UploadSession.get_upload_dir()])
+        referenced_names = set(Thesis.objects.exclude(document='').values_list('document', flat=True))
+        cutoff = time.time() - grace_period
+        return sorted(name for name in set(stored_files) - referenced_names if stored_files[name] < cutoff)
+
+    @staticmethod
+    def delete_orphaned_files(grace_period=storage.DEFAULT_ORPHAN_GRACE_PERIOD, workers=1):
+        '''Delete the files from find_orphaned_files(), returning their names.'''
+        document_storage = Thesis._meta.get_field('document').storage
+        orphans = Thesis.find_orphaned_files(grace_period)
+        return storage.delete_files(document_storage.location, orphans, time.time() - grace_period, workers=workers)
+
+    def update_keywords(self, keywords):
+        '''Set the thesis keywords, just removing the ones that were taken out & adding the new ones
+        (instead of clearing & re-adding them all). Does nothing else if the keywords haven't changed.'''
+        new_ids = set(keyword.pk for keyword in keywords)
+        current_ids = set(Thesis.keywords.through.objects.filter(thesis_id=self.pk).values_list('keyword_id', flat=True))
+        removed_ids = current_ids - new_ids
+        added_ids = new_ids - current_ids
+        if removed_ids:
+            self.keywords.remove(*removed_ids)
+        if added_ids:
+            self.keywords.add(*added_ids)
+
     def metadata_complete(self):
         if self.title and self.abstract and self.keywords:
             return True
@@ -374,6 +700,117 @@ class Thesis(models.Model):
         self.save()
 
 
+def _get_thesis_keyword_ids(instance, reverse, pk_set):
+    #the keyword id for each thesis-keyword link that a remove or clear will delete
+    links = Thesis.keywords.through.objects.all()
+    if reverse:
+        links = links.filter(keyword_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(thesis_id__in=pk_set)
+    else:
+        links = links.filter(thesis_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(keyword_id__in=pk_set)
+    return list(links.values_list('keyword_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Thesis.keywords.through)
+def _thesis_keywords_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action == 'post_add':
+        #pk_set only has the newly-added objects
+        if reverse:
+            Keyword.update_usage_counts([instance.pk] * len(pk_set), 1)
+        else:
+            Keyword.update_usage_counts(pk_set, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        #pk_set can include objects that weren't linked, so find the links that are really going away
+        instance._removed_keyword_ids = _get_thesis_keyword_ids(instance, reverse, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        Keyword.update_usage_counts(getattr(instance, '_removed_keyword_ids', []), -1)
+        instance._removed_keyword_ids = []
+
+
+class FixityCheck(models.Model):
+    '''The result of checking a stored thesis file against the thesis checksum.'''
+    thesis = models.ForeignKey(Thesis, related_name='fixity_checks')
+    file_name = models.CharField(max_length=100)
+    expected_checksum = models.CharField(max_length=100)
+    found_checksum = models.CharField(max_length=100, blank=True)
+    passed = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    checked = models.DateTimeField(db_index=True)
+
+    def __unicode__(self):
+        return '%s %s %s' % (self.file_name, 'passed' if self.passed else 'FAILED', self.checked)
+
+    @staticmethod
+    def get_theses_to_check(limit=None):
+        '''(thesis id, file name, checksum) for the theses with files, starting with the ones that
+        haven't been checked, and then the ones that were checked longest ago.'''
+        rows = Thesis.objects.exclude(document='').annotate(last_checked=Max('fixity_checks__checked')).values_list(
+                'id', 'document', 'checksum', 'last_checked')
+        rows = sorted(rows, key=lambda row: (row[3] is not None, row[3], row[0]))
+        return [row[:3] for row in rows[:limit]]
+
+    @staticmethod
+    def run(limit=None, workers=1, bytes_per_second=None):
+        '''Re-hash the stored files for the next theses to check (in parallel, if workers > 1), & save the results.
+        Returns the new FixityChecks.'''
+        document_storage = Thesis._meta.get_field('document').storage
+        #identical files are only stored once, so each file is hashed once for all the theses that use it
+        theses_by_path = {}
+        paths = []
+        for thesis_id, file_name, checksum in FixityCheck.get_theses_to_check(limit):
+            path = document_storage.path(file_name)
+            if path not in theses_by_path:
+                theses_by_path[path] = []
+                paths.append(path)
+            theses_by_path[path].append((thesis_id, file_name, checksum))
+        results = []
+        for path, found_checksum, error in checksums.file_digests(paths, workers=workers, bytes_per_second=bytes_per_second):
+            checked = timezone.now()
+            for thesis_id, file_name, checksum in theses_by_path[path]:
+                results.append(FixityCheck.objects.create(thesis_id=thesis_id, file_name=file_name, expected_checksum=checksum,
+                        found_checksum=found_checksum, passed=bool(found_checksum) and found_checksum == checksum,
+                        error=error, checked=checked))
+        return results
+
+
+class UploadSession(models.Model):
+    '''A thesis file that's being uploaded in chunks, so the upload can be resumed if the connection drops.
+    The chunks are appended to a file in THESIS_UPLOAD_SESSION_DIR; offset is how many bytes we have so far.'''
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    candidate = models.ForeignKey('Candidate')
+    file_name = models.CharField(max_length=190)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return '%s (%s/%s)' % (self.file_name, self.offset, self.size)
+
+    @staticmethod
+    def get_upload_dir():
+        #needs to be shared by all the app servers, if there's more than one
+        upload_dir = getattr(settings, 'THESIS_UPLOAD_SESSION_DIR', None) or os.path.join(tempfile.gettempdir(), 'etd_upload_sessions')
+        if not os.path.exists(upload_dir):
+            os.makedirs(upload_dir)
+        return upload_dir
+
+    @property
+    def path(self):
+        return os.path.join(UploadSession.get_upload_dir(), self.id.hex)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def status(self):
+        return {'id': self.id.hex, 'file_name': self.file_name, 'size': self.size, 'offset': self.offset, 'complete': self.complete}
+
+
 class CommitteeMember(models.Model):
     MEMBER_ROLES = Choices(
             ('reader', 'Reader'),
@@ -423,38 +860,287 @@ class Candidate(models.Model):
         if not hasattr(self, 'gradschool_checklist'):
             GradschoolChecklist.objects.create(candidate=self)
         if not hasattr(self, 'thesis'):
-            Thesis.objects.create(candidate=self)
+            Thesis.objects.create(candidate=self) #creating the thesis also creates the summary
+        else:
+            CandidateSummary.update_for_candidate(self)
 
     @staticmethod
     def _get_order_by_field(sort_by_param):
+        #just one leading '-' for descending - anything else (eg. '--title') gets the default ordering
+        if sort_by_param.startswith('-') and not sort_by_param.startswith('--'):
+            return '-%s' % Candidate._get_order_by_field(sort_by_param[1:])
+        #sorting is done on the (indexed) summary table, so the listing doesn't have to join the other tables
         if sort_by_param == 'title':
-            return 'thesis__title'
+            return 'summary__title'
         elif sort_by_param == 'date_registered':
-            return 'date_registered'
+            return 'summary__date_registered'
         elif sort_by_param == 'date_submitted':
-            return 'thesis__date_submitted'
+            return 'summary__date_submitted'
         elif sort_by_param == 'department':
-            return 'department__name'
+            return 'summary__department_name'
         elif sort_by_param == 'status':
-            return 'thesis__status'
+            return 'summary__thesis_status'
         else:
-            return 'person__last_name'
+            return 'summary__last_name'
 
     @staticmethod
-    def get_candidates_by_status(status, sort_param=None):
+    def _get_order_by_fields(sort_param):
+        #sort_param can have multiple comma-separated keys, each optionally prefixed with '-' for descending
         if sort_param:
-            order_by_field = Candidate._get_order_by_field(sort_param)
+            order_by_fields = [Candidate._get_order_by_field(key.strip()) for key in sort_param.split(',') if key.strip()]
         else:
-            order_by_field = 'person__last_name'
+            order_by_fields = []
+        if not order_by_fields:
+            order_by_fields = ['summary__last_name']
+        #always finish with id, so the ordering is stable for paging
+        order_by_fields.append('id')
+        return order_by_fields
+
+    @staticmethod
+    def _get_keyset_filter(order_by_fields, last_values):
+        '''Build a filter for the rows that sort after last_values (the values of order_by_fields for
+        the last row of the previous page). This lets us page with an indexed WHERE clause, instead of OFFSET.
+        NULLs are assumed to sort first in ascending order, as they do in MySQL & SQLite.'''
+        keyset_filter = None
+        equal_filter = Q()
+        for order_by_field, value in zip(order_by_fields, last_values):
+            field = order_by_field.lstrip('-')
+            descending = order_by_field.startswith('-')
+            if value is None:
+                #everything non-null comes after NULL ascending, and nothing comes after it descending
+                after_filter = None if descending else Q(**{'%s__isnull' % field: False})
+            elif descending:
+                after_filter = Q(**{'%s__lt' % field: value}) | Q(**{'%s__isnull' % field: True})
+            else:
+                after_filter = Q(**{'%s__gt' % field: value})
+            if after_filter is not None:
+                after_filter = equal_filter & after_filter
+                keyset_filter = after_filter if keyset_filter is None else (keyset_filter | after_filter)
+            if value is None:
+                equal_filter &= Q(**{'%s__isnull' % field: True})
+            else:
+                equal_filter &= Q(**{field: value})
+        return keyset_filter
+
+    @staticmethod
+    def _paperwork_complete_filter():
+        #same logic as GradschoolChecklist.complete(), but done in the db so we don't
+        #   have to load every candidate & checklist to figure out which ones are complete
+        complete = Q(gradschool_checklist__bursar_receipt__isnull=False,
+                     gradschool_checklist__pages_submitted_to_gradschool__isnull=False)
+        doctorate_complete = Q(gradschool_checklist__dissertation_fee__isnull=False,
+                               gradschool_checklist__gradschool_exit_survey__isnull=False,
+                               gradschool_checklist__earned_docs_survey__isnull=False)
+        return complete & (Q(degree__degree_type=Degree.TYPES.masters) | doctorate_complete)
+
+    @staticmethod
+    def get_listing_queryset():
+        #everything the staff candidate listing displays is in the summary, so it all comes back in one
+        #   query, without joining the person, department, & thesis of each row
+        return Candidate.objects.select_related('summary').only('id')
+
+    @staticmethod
+    def get_candidates_by_status(status, sort_param=None):
+        order_by_fields = Candidate._get_order_by_fields(sort_param)
+        candidates = Candidate.get_listing_queryset()
         if status == 'all':
-            return Candidate.objects.all().order_by(order_by_field)
-        elif status == 'in_progress': #dissertation not submitted yet
-            return Candidate.objects.filter(thesis__status='not_submitted').order_by(order_by_field)
-        elif status == 'awaiting_gradschool': #dissertation submitted, needs to be checked by grad school
-            return Candidate.objects.filter(thesis__status='pending').order_by(order_by_field)
-        elif status == 'dissertation_rejected': #dissertation needs to be resubmitted
-            return Candidate.objects.filter(thesis__status='rejected').order_by(order_by_field)
-        elif status == 'paperwork_incomplete': #dissertation approved, still need paperwork
-            return [c for c in Candidate.objects.filter(thesis__status='accepted').order_by(order_by_field) if not c.gradschool_checklist.complete()]
-        elif status == 'complete': #dissertation approved, paperwork complete - everything done
-            return [c for c in Candidate.objects.filter(thesis__status='accepted').order_by(order_by_field) if c.gradschool_checklist.complete()]
+            return candidates.order_by(*order_by_fields)
+        elif status in CandidateSummary.WORKFLOW_STATUSES:
+            #the workflow status is kept up-to-date in the (indexed) summary table
+            return candidates.filter(summary__workflow_status=status).order_by(*order_by_fields)
+
+    @staticmethod
+    def _get_page(candidates, order_by_fields, after, page_size, lookup_candidates=None):
+        #lookup_candidates is used to find the sort values of the "after" candidate - it has to
+        #   have any annotations the ordering uses, but shouldn't be filtered, in case that candidate changed
+        if after:
+            lookup_candidates = lookup_candidates if lookup_candidates is not None else Candidate.objects.all()
+            try:
+                last_values = lookup_candidates.filter(id=after).values_list(*[f.lstrip('-') for f in order_by_fields]).get()
+            except Candidate.DoesNotExist:
+                raise CandidateException('invalid page: candidate %s not found' % after)
+            candidates = candidates.filter(Candidate._get_keyset_filter(order_by_fields, last_values))
+        #grab one extra, so we know if there's another page
+        candidates = list(candidates[:page_size + 1])
+        if len(candidates) > page_size:
+            candidates = candidates[:page_size]
+            return candidates, candidates[-1].id
+        return candidates, None
+
+    @staticmethod
+    def get_candidates_page(status, sort_param=None, after=None, page_size=100):
+        '''Returns one page of candidates, plus the id to pass in as "after" to get the next page
+        (None if this is the last page). "after" is the id of the last candidate on the previous page.'''
+        candidates = Candidate.get_candidates_by_status(status, sort_param)
+        return Candidate._get_page(candidates, Candidate._get_order_by_fields(sort_param), after, page_size)
+
+    @staticmethod
+    def _get_search_filter(word):
+        #each column gets its own prefix query, as a subquery, so the indexes on the person & department
+        #   columns can be used, instead of OR-ing them all together over a join of every table
+        #the title is matched on the summary's indexed copy of it - only the start of the title, since
+        #   matching later words would mean scanning every title
+        search_filter = Q(department_id__in=Department.objects.filter(name__istartswith=word).values('id'))
+        for field in ['last_name', 'first_name', 'netid', 'email']:
+            search_filter |= Q(person_id__in=Person.objects.filter(**{'%s__istartswith' % field: word}).values('id'))
+        return search_filter | Q(id__in=CandidateSummary.objects.filter(title__istartswith=word).values('candidate_id'))
+
+    @staticmethod
+    def _get_search_rank_expression(query, first_word):
+        #lower is better: exact ids first, then names, then everything else
+        return Case(
+                When(Q(person__netid__iexact=query) | Q(person__email__iexact=query), then=Value(0)),
+                When(person__last_name__iexact=first_word, then=Value(1)),
+                When(person__last_name__istartswith=first_word, then=Value(2)),
+                When(Q(person__first_name__istartswith=first_word) | Q(person__netid__istartswith=first_word) |
+                     Q(person__email__istartswith=first_word), then=Value(3)),
+                When(thesis__title__istartswith=first_word, then=Value(4)),
+                default=Value(5), output_field=models.IntegerField())
+
+    @staticmethod
+    def search(query, after=None, page_size=100):
+        '''Find candidates by name, netid, email, thesis title, or department. Every word in the query
+        has to match the start of one of those fields. Returns a page of results (best matches first),
+        plus the id to pass in as "after" for the next page, like get_candidates_page().'''
+        words = query.split()
+        if not words:
+            return [], None
+        rank = Candidate._get_search_rank_expression(query.strip(), words[0])
+        candidates = Candidate.get_listing_queryset().annotate(search_rank=rank)
+        for word in words:
+            candidates = candidates.filter(Candidate._get_search_filter(word))
+        order_by_fields = ['search_rank', 'summary__last_name', 'id']
+        return Candidate._get_page(candidates.order_by(*order_by_fields), order_by_fields, after, page_size,
+                                   lookup_candidates=Candidate.objects.annotate(search_rank=rank))
+
+
+STATUS_COUNTS_CACHE_KEY = 'etd_app_candidate_status_counts'
+
+
+class CandidateSummary(models.Model):
+    '''Denormalized copy of the information the staff dashboard needs for each candidate, including
+    which step of the workflow they're at. Kept up-to-date whenever the candidate, thesis, person,
+    department, or gradschool checklist is saved, and can be rebuilt from scratch with the
+    rebuild_candidate_summaries command.'''
+    WORKFLOW_STATUSES = Choices(
+            ('in_progress', 'In progress (dissertation not yet submitted)'),
+            ('awaiting_gradschool', 'Dissertation submitted, Grad school action needed'),
+            ('dissertation_rejected', 'Dissertation rejected, awaiting resubmission'),
+            ('paperwork_incomplete', 'Dissertation approved, paperwork incomplete'),
+            ('complete', 'Dissertation approved, paperwork complete'),
+        )
+    #thesis statuses that map directly to a workflow status - accepted theses depend on the paperwork
+    THESIS_STATUS_WORKFLOW_STATUSES = {
+            Thesis.STATUS_CHOICES.not_submitted: WORKFLOW_STATUSES.in_progress,
+            Thesis.STATUS_CHOICES.pending: WORKFLOW_STATUSES.awaiting_gradschool,
+            Thesis.STATUS_CHOICES.rejected: WORKFLOW_STATUSES.dissertation_rejected,
+        }
+
+    candidate = models.OneToOneField(Candidate, related_name='summary')
+    workflow_status = models.CharField(max_length=50, choices=WORKFLOW_STATUSES, blank=True) #blank for ingested theses
+    last_name = models.CharField(max_length=190, db_index=True)
+    first_name = models.CharField(max_length=190)
+    department_name = models.CharField(max_length=190)
+    title = models.CharField(max_length=255, db_index=True)
+    thesis_status = models.CharField(max_length=50, choices=Thesis.STATUS_CHOICES)
+    date_registered = models.DateField()
+    date_submitted = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        #one index for each column the dashboard can sort by, within a workflow status
+        index_together = [
+                ['workflow_status', 'last_name'],
+                ['workflow_status', 'title'],
+                ['workflow_status', 'department_name'],
+                ['workflow_status', 'date_registered'],
+                ['workflow_status', 'date_submitted'],
+                ['workflow_status', 'thesis_status'],
+            ]
+
+    def __unicode__(self):
+        return '%s (%s)' % (self.candidate_id, self.workflow_status)
+
+    @staticmethod
+    def get_workflow_status(candidate):
+        thesis_status = candidate.thesis.status
+        if thesis_status in CandidateSummary.THESIS_STATUS_WORKFLOW_STATUSES:
+            return CandidateSummary.THESIS_STATUS_WORKFLOW_STATUSES[thesis_status]
+        elif thesis_status == Thesis.STATUS_CHOICES.accepted:
+            if candidate.gradschool_checklist.complete():
+                return CandidateSummary.WORKFLOW_STATUSES.complete
+            else:
+                return CandidateSummary.WORKFLOW_STATUSES.paperwork_incomplete
+        return ''
+
+    @staticmethod
+    def update_for_candidate(candidate):
+        thesis = candidate.thesis
+        values = {
+                'workflow_status': CandidateSummary.get_workflow_status(candidate),
+                'last_name': candidate.person.last_name,
+                'first_name': candidate.person.first_name,
+                'department_name': candidate.department.name,
+                'title': thesis.title,
+                'thesis_status': thesis.status,
+                'date_registered': candidate.date_registered,
+                'date_submitted': thesis.date_submitted,
+            }
+        CandidateSummary.objects.update_or_create(candidate=candidate, defaults=values)
+        cache.delete(STATUS_COUNTS_CACHE_KEY)
+
+    @staticmethod
+    def _get_workflow_status_expression():
+        #same logic as get_workflow_status(), but as a db expression, so it can be computed for all candidates at once
+        whens = [When(thesis__status=thesis_status, then=Value(workflow_status))
+                 for thesis_status, workflow_status in CandidateSummary.THESIS_STATUS_WORKFLOW_STATUSES.items()]
+        whens.append(When(Q(thesis__status=Thesis.STATUS_CHOICES.accepted) & Candidate._paperwork_complete_filter(),
+                          then=Value(CandidateSummary.WORKFLOW_STATUSES.complete)))
+        whens.append(When(thesis__status=Thesis.STATUS_CHOICES.accepted,
+                          then=Value(CandidateSummary.WORKFLOW_STATUSES.paperwork_incomplete)))
+        return Case(*whens, default=Value(''), output_field=models.CharField())
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        '''Recreate the summaries for all candidates, in bulk. Returns the number of summaries created.'''
+        rows = Candidate.objects.filter(thesis__isnull=False).annotate(workflow_status=CandidateSummary._get_workflow_status_expression()).values_list(
+                'id', 'workflow_status', 'person__last_name', 'person__first_name', 'department__name',
+                'thesis__title', 'thesis__status', 'date_registered', 'thesis__date_submitted')
+        count = 0
+        with transaction.atomic():
+            CandidateSummary.objects.all().delete()
+            summaries = []
+            for row in rows.iterator():
+                summaries.append(CandidateSummary(candidate_id=row[0], workflow_status=row[1], last_name=row[2],
+                    first_name=row[3], department_name=row[4], title=row[5], thesis_status=row[6],
+                    date_registered=row[7], date_submitted=row[8]))
+                if len(summaries) >= batch_size:
+                    CandidateSummary.objects.bulk_create(summaries)
+                    count += len(summaries)
+                    summaries = []
+            CandidateSummary.objects.bulk_create(summaries)
+            count += len(summaries)
+        cache.delete(STATUS_COUNTS_CACHE_KEY)
+        return count
+
+    @staticmethod
+    def get_status_counts():
+        '''Number of candidates in each workflow status (plus 'all'), from one aggregate query.'''
+        counts = dict((status, 0) for status, display in CandidateSummary.WORKFLOW_STATUSES)
+        total = 0
+        for row in CandidateSummary.objects.values('workflow_status').annotate(count=Count('id')).order_by():
+            if row['workflow_status']:
+                counts[row['workflow_status']] = row['count']
+            total += row['count']
+        counts['all'] = total
+        return counts
+
+    @staticmethod
+    def get_cached_status_counts():
+        '''Same as get_status_counts(), but cached - the cache is cleared whenever a summary changes.
+        The timeout is just a backstop, in case the db gets updated some other way.'''
+        counts = cache.get(STATUS_COUNTS_CACHE_KEY)
+        if counts is None:
+            counts = CandidateSummary.get_status_counts()
+            cache.set(STATUS_COUNTS_CACHE_KEY, counts, getattr(settings, 'STATUS_COUNTS_CACHE_TIMEOUT', 300))
+        return counts
@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+import os
+import threading
+import uuid
+from Queue import Queue, Empty
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+#Thesis files are stored by checksum, in two levels of shard directories (eg. b1/93/b1938fc5...pdf), so no
+#  directory gets too big, and uploading the same file again doesn't store another copy of it.
+
+
+#files that have been modified more recently than this aren't treated as orphans, in case they're still being saved
+DEFAULT_ORPHAN_GRACE_PERIOD = 24 * 60 * 60
+
+
+def content_addressed_name(checksum, extension='.pdf'):
+    return os.path.join(checksum[:2], checksum[2:4], '%s%s' % (checksum, extension.lower()))
+
+
+def thesis_file_name(thesis, file_name):
+    #upload_to for Thesis.document - the thesis checksum has been set before the file is saved
+    return content_addressed_name(thesis.checksum, os.path.splitext(file_name)[1])
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''File storage where the name of a file comes from its content, so if a file with that name
+    is there already, it's the same file & doesn't need to be saved again.'''
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            #touch the file, so it's not cleaned up as an orphan before the thesis that uses it is saved
+            os.utime(self.path(name), None)
+            return name
+        #write to a temporary file & rename it into place, in case the same file is being saved twice at once
+        tmp_name = super(ContentAddressedStorage, self)._save('%s.%s.tmp' % (name, uuid.uuid4().hex), content)
+        os.rename(self.path(tmp_name), self.path(name))
+        return name
+
+
+def list_files(root, exclude_dirs=()):
+    '''{name relative to root: modification time} for all the files under root (skipping exclude_dirs).'''
+    exclude_dirs = set(os.path.realpath(d) for d in exclude_dirs)
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if os.path.realpath(os.path.join(dir_path, d)) not in exclude_dirs]
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            try:
+                files[os.path.relpath(path, root)] = os.path.getmtime(path)
+            except OSError:
+                pass #deleted while we were looking
+    return files
+
+
+def delete_files(root, names, modified_before, workers=1):
+    '''Delete the named files under root, in worker threads if workers > 1. Files modified since the modified_before
+    timestamp are left, since they might have been re-used since they were found. Returns the names that were deleted.'''
+    queue = Queue()
+    for name in names:
+        queue.put(name)
+    deleted = []
+    lock = threading.Lock()
+
+    def _delete():
+        while True:
+            try:
+                name = queue.get_nowait()
+            except Empty:
+                return
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < modified_before:
+                    os.remove(path)
+                    with lock:
+                        deleted.append(name)
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=_delete) for i in range(max(workers, 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(deleted)
@@ -0,0 +1,203 @@
+from __future__ import unicode_literals
+import fcntl
+import io
+import os
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.utils import timezone
+from .checksums import DigestCalculator, CHUNK_SIZE
+from .models import Thesis, UploadSession
+from .storage import list_files
+
+
+PDF_MAGIC = b'%PDF-'
+DEFAULT_MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+#upload sessions that haven't had a chunk for this long are abandoned, & can be deleted
+DEFAULT_UPLOAD_SESSION_EXPIRY = 24 * 60 * 60
+
+
+class UploadSessionException(Exception):
+    pass
+
+
+def _get_max_upload_size():
+    return getattr(settings, 'THESIS_MAX_UPLOAD_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+def _get_upload_session_expiry():
+    return getattr(settings, 'THESIS_UPLOAD_SESSION_EXPIRY', DEFAULT_UPLOAD_SESSION_EXPIRY)
+
+
+class ThesisUploadHandler(TemporaryFileUploadHandler):
+    '''Saves the upload to a temp file like the default handler, but also calculates the thesis
+    digests as the chunks come in, so the file doesn't have to be read again to get its checksum.
+
+    If the file doesn't start like a PDF, or is bigger than THESIS_MAX_UPLOAD_SIZE, we stop the upload
+    right away, without reading the rest of the request - the form doesn't get a file then, so the
+    error goes on the request as upload_error, for the form to report.'''
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super(ThesisUploadHandler, self).new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.max_size = _get_max_upload_size()
+        self.calculator = DigestCalculator(Thesis.get_digest_algorithms())
+        self.header = b''
+        self.upload_error = None
+        if content_length and content_length > self.max_size:
+            self._stop_upload(self._too_large_message())
+
+    def _too_large_message(self):
+        return 'file is too large (the limit is %s MB)' % (self.max_size // (1024 * 1024))
+
+    def _stop_upload(self, upload_error):
+        self.upload_error = self.request.upload_error = upload_error
+        raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.header) < len(PDF_MAGIC):
+            self.header += raw_data[:len(PDF_MAGIC) - len(self.header)]
+            if not PDF_MAGIC.startswith(self.header[:len(PDF_MAGIC)]):
+                self._stop_upload('file must be a PDF')
+        if start + len(raw_data) > self.max_size:
+            self._stop_upload(self._too_large_message())
+        self.calculator.update(raw_data)
+        return super(ThesisUploadHandler, self).receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super(ThesisUploadHandler, self).file_complete(file_size)
+        #too short to tell it was a PDF until now
+        if len(self.header) < len(PDF_MAGIC):
+            self.upload_error = 'file must be a PDF'
+        uploaded_file.upload_error = self.upload_error
+        if not self.upload_error:
+            uploaded_file.digests = self.calculator.hexdigests()
+        return uploaded_file
+
+
+#resumable uploads: the client starts an UploadSession, sends the file in chunks (each one starting at the
+#  offset we have so far), & then finishes the session, which gives back the whole file for the UploadForm.
+#The digests are calculated as the chunks come in, as long as they all come to this process - if not, the
+#  file is hashed when it's saved to the thesis instead.
+#Sessions that haven't been touched for THESIS_UPLOAD_SESSION_EXPIRY seconds are removed by
+#  delete_expired_upload_sessions() (see the delete_expired_upload_sessions command).
+
+#{upload session id: (DigestCalculator, time it was last used)}
+_calculators = {}
+_calculators_lock = threading.Lock()
+
+
+def _put_calculator(upload_session_id, calculator):
+    #also drop any calculators for sessions that were abandoned, so they don't pile up in this process
+    now = time.time()
+    cutoff = now - _get_upload_session_expiry()
+    with _calculators_lock:
+        for expired_id in [i for i, (c, last_used) in _calculators.items() if last_used < cutoff]:
+            del _calculators[expired_id]
+        _calculators[upload_session_id] = (calculator, now)
+
+
+def _pop_calculator(upload_session_id):
+    with _calculators_lock:
+        calculator, last_used = _calculators.pop(upload_session_id, (None, None))
+    return calculator
+
+
+def start_upload_session(candidate, file_name, size):
+    if not file_name.endswith('.pdf'):
+        raise UploadSessionException('file must be a PDF')
+    if size <= 0:
+        raise UploadSessionException('file is empty')
+    max_size = _get_max_upload_size()
+    if size > max_size:
+        raise UploadSessionException('file is too large (the limit is %s MB)' % (max_size // (1024 * 1024)))
+    upload_session = UploadSession.objects.create(candidate=candidate, file_name=file_name, size=size)
+    io.open(upload_session.path, 'wb').close()
+    _put_calculator(upload_session.id, DigestCalculator(Thesis.get_digest_algorithms()))
+    return upload_session
+
+
+def append_chunk(upload_session, stream, offset):
+    '''Append the data in stream to the upload, if offset is where the upload is up to. If the connection
+    drops in the middle of the chunk, whatever we received is kept, & the client can carry on from there.'''
+    with io.open(upload_session.path, 'r+b') as f:
+        #one chunk at a time for each session - a concurrent PUT for the same session (eg. a client retrying
+        #  a chunk it thinks failed) waits here until this one's done, & then sees the new offset
+        fcntl.flock(f, fcntl.LOCK_EX)
+        offsets = list(UploadSession.objects.filter(id=upload_session.id).values_list('offset', flat=True))
+        if not offsets:
+            raise UploadSessionException('upload session has been discarded')
+        upload_session.offset = offsets[0]
+        if offset != upload_session.offset:
+            raise UploadSessionException('chunk offset is %s, but the upload is at %s' % (offset, upload_session.offset))
+        calculator = _pop_calculator(upload_session.id)
+        if calculator and calculator.size != offset:
+            calculator = None
+        try:
+            #drop anything past the offset (eg. from a chunk that was written, but the offset wasn't saved)
+            f.truncate(offset)
+            f.seek(offset)
+            while True:
+                data = stream.read(CHUNK_SIZE)
+                if not data:
+                    break
+                if upload_session.offset + len(data) > upload_session.size:
+                    raise UploadSessionException('chunk goes past the end of the file')
+                f.write(data)
+                if calculator:
+                    calculator.update(data)
+                upload_session.offset += len(data)
+            f.seek(0)
+            if upload_session.offset >= len(PDF_MAGIC) and f.read(len(PDF_MAGIC)) != PDF_MAGIC:
+                raise UploadSessionException('file must be a PDF')
+        finally:
+            #only if nothing else has moved the offset (eg. if the lock didn't hold on a shared filesystem)
+            updated = UploadSession.objects.filter(id=upload_session.id, offset=offset).update(
+                    offset=upload_session.offset, modified=timezone.now())
+            if updated and calculator and calculator.size == upload_session.offset:
+                _put_calculator(upload_session.id, calculator)
+    if not updated:
+        raise UploadSessionException('upload changed while the chunk was being written - check the offset & try again')
+
+
+def finish_upload_session(upload_session):
+    '''Returns the uploaded file, with its digests if we have them - the caller needs to close it,
+    & discard the session when it's done.'''
+    if not upload_session.complete:
+        raise UploadSessionException('upload is incomplete: %s of %s bytes' % (upload_session.offset, upload_session.size))
+    uploaded_file = UploadedFile(io.open(upload_session.path, 'rb'), name=upload_session.file_name,
+            content_type='application/pdf', size=upload_session.size)
+    calculator = _pop_calculator(upload_session.id)
+    if calculator and calculator.size == upload_session.size:
+        uploaded_file.digests = calculator.hexdigests()
+    return uploaded_file
+
+
+def discard_upload_session(upload_session):
+    _pop_calculator(upload_session.id)
+    if os.path.exists(upload_session.path):
+        os.remove(upload_session.path)
+    upload_session.delete()
+
+
+def delete_expired_upload_sessions(expiry=None):
+    '''Discard the upload sessions that haven't been touched for expiry seconds (THESIS_UPLOAD_SESSION_EXPIRY
+    by default), & any files in the upload session directory that are that old & don't have a session.
+    Returns the number of sessions & the number of stray files that were deleted.'''
+    if expiry is None:
+        expiry = _get_upload_session_expiry()
+    expired_sessions = list(UploadSession.objects.filter(modified__lt=timezone.now() - timedelta(seconds=expiry)))
+    for upload_session in expired_sessions:
+        discard_upload_session(upload_session)
+    upload_dir = UploadSession.get_upload_dir()
+    session_file_names = set(upload_session_id.hex for upload_session_id in UploadSession.objects.values_list('id', flat=True))
+    cutoff = time.time() - expiry
+    stray_files = [name for name, modified in list_files(upload_dir).items() if name not in session_file_names and modified < cutoff]
+    for name in stray_files:
+        try:
+            os.remove(os.path.join(upload_dir, name))
+        except OSError:
+            pass #already gone
+    return len(expired_sessions), len(stray_files)
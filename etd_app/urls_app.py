@@ -12,6 +12,9 @@ urlpatterns = [
         url(regex=r'^register/$', view=views.register, name='register'),
         url(regex=r'^candidate/$', view=views.candidate_home, name='candidate_home'),
         url(regex=r'^candidate/upload/$', view=views.candidate_upload, name='candidate_upload'),
+        url(regex=r'^candidate/upload/sessions/$', view=views.candidate_upload_start, name='candidate_upload_start'),
+        url(regex=r'^candidate/upload/sessions/(?P<upload_id>[0-9a-f]{32})/$', view=views.candidate_upload_session, name='candidate_upload_session'),
+        url(regex=r'^candidate/upload/sessions/(?P<upload_id>[0-9a-f]{32})/finish/$', view=views.candidate_upload_finish, name='candidate_upload_finish'),
         url(regex=r'^candidate/metadata/$', view=views.candidate_metadata, name='candidate_metadata'),
         url(regex=r'^candidate/committee/$', view=views.candidate_committee, name='candidate_committee'),
         url(regex=r'^candidate/committee/(?P<cm_id>\d+)/remove/$', view=views.candidate_committee_remove, name='candidate_committee_remove'),
@@ -22,6 +25,12 @@ urlpatterns = [
             regex=r'^review/(?P<status>all|in_progress|awaiting_gradschool|dissertation_rejected|paperwork_incomplete|complete)/$',
             view=views.staff_view_candidates,
             name='review_candidates'),
+        url(
+            regex=r'^review/(?P<status>all|in_progress|awaiting_gradschool|dissertation_rejected|paperwork_incomplete|complete)/export/$',
+            view=views.staff_export_candidates,
+            name='review_export'),
+        url(regex=r'^review/counts/$', view=views.staff_status_counts, name='review_status_counts'),
+        url(regex=r'^review/search/$', view=views.staff_search, name='review_search'),
         url(regex=r'^review/(?P<candidate_id>\d+)/$', view=views.staff_approve, name='approve'),
         url(regex=r'^review/(?P<candidate_id>\d+)/format_post/$', view=views.staff_format_post, name='format_post'),
         url(regex=r'^(?P<candidate_id>\d+)/abstract/$', view=views.view_abstract, name='abstract'),
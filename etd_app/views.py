@@ -1,20 +1,30 @@
 from __future__ import unicode_literals
+import hashlib
+import json
 import logging
-import os
+import threading
+import time
 import urllib
-import requests
 from django.contrib.auth.decorators import login_required, permission_required
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect, HttpResponseForbidden, JsonResponse, FileResponse, HttpResponseServerError
+from django.http import HttpResponseRedirect, HttpResponseForbidden, HttpResponseBadRequest, JsonResponse, HttpResponseServerError, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.views.decorators.http import require_http_methods
-from .models import Person, Candidate, Keyword, CommitteeMember
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_http_methods, etag
+from .models import Person, Candidate, CandidateSummary, Keyword, FastSubject, UploadSession, CommitteeMember, CandidateException
+from .uploads import (ThesisUploadHandler, UploadSessionException, start_upload_session, append_chunk,
+        finish_upload_session, discard_upload_session)
 from .widgets import ID_VAL_SEPARATOR
+from . import fast
+from . import file_serving
 
 
 logger = logging.getLogger('etd')
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
 
 def login(request):
     if request.user.is_authenticated():
@@ -116,7 +126,16 @@ def candidate_home(request):
 
 
 @login_required
+@csrf_exempt
 def candidate_upload(request):
+    #the upload handler has to be set before anything reads the POST data (including the csrf check),
+    #  so the csrf check happens in _candidate_upload instead
+    request.upload_handlers = [ThesisUploadHandler(request)]
+    return _candidate_upload(request)
+
+
+@csrf_protect
+def _candidate_upload(request):
     from .forms import UploadForm
     try:
         candidate = Candidate.objects.get(person__netid=request.user.username)
@@ -125,7 +144,7 @@ def candidate_upload(request):
     if candidate.thesis.is_locked():
         return HttpResponseForbidden('Thesis has already been accepted and is locked.')
     if request.method == 'POST':
-        form = UploadForm(request.POST, request.FILES)
+        form = UploadForm(request.POST, request.FILES, upload_error=getattr(request, 'upload_error', None))
         if form.is_valid():
             form.save_upload(candidate)
             return HttpResponseRedirect(reverse('candidate_home'))
@@ -134,6 +153,71 @@ def candidate_upload(request):
     return render(request, 'etd_app/candidate_upload.html', {'candidate': candidate, 'form': form})
 
 
+@login_required
+@require_http_methods(['POST'])
+def candidate_upload_start(request):
+    try:
+        candidate = Candidate.objects.get(person__netid=request.user.username)
+    except Candidate.DoesNotExist:
+        return HttpResponseRedirect(reverse('register'))
+    if candidate.thesis.is_locked():
+        return HttpResponseForbidden('Thesis has already been accepted and is locked.')
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return HttpResponseBadRequest('invalid size')
+    try:
+        upload_session = start_upload_session(candidate, request.POST.get('file_name', ''), size)
+    except UploadSessionException as e:
+        return JsonResponse({'error': '%s' % e}, status=400)
+    response = JsonResponse(upload_session.status(), status=201)
+    response['Location'] = reverse('candidate_upload_session', kwargs={'upload_id': upload_session.id.hex})
+    return response
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def candidate_upload_session(request, upload_id):
+    #GET for the status of the upload, or PUT the next chunk (with its offset in the Upload-Offset header)
+    upload_session = get_object_or_404(UploadSession, id=upload_id, candidate__person__netid=request.user.username)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+        except ValueError:
+            return HttpResponseBadRequest('invalid Upload-Offset')
+        if offset != upload_session.offset:
+            #the client needs to carry on from the offset we have
+            return JsonResponse(upload_session.status(), status=409)
+        try:
+            append_chunk(upload_session, request, offset)
+        except UploadSessionException as e:
+            return JsonResponse(dict(upload_session.status(), error='%s' % e), status=400)
+    return JsonResponse(upload_session.status())
+
+
+@login_required
+@require_http_methods(['POST'])
+def candidate_upload_finish(request, upload_id):
+    from .forms import UploadForm
+    upload_session = get_object_or_404(UploadSession, id=upload_id, candidate__person__netid=request.user.username)
+    candidate = upload_session.candidate
+    if candidate.thesis.is_locked():
+        return HttpResponseForbidden('Thesis has already been accepted and is locked.')
+    try:
+        thesis_file = finish_upload_session(upload_session)
+    except UploadSessionException as e:
+        return JsonResponse(dict(upload_session.status(), error='%s' % e), status=400)
+    try:
+        form = UploadForm(data={}, files={'thesis_file': thesis_file})
+        if not form.is_valid():
+            return JsonResponse({'error': ' '.join(form.errors.get('thesis_file', []))}, status=400)
+        form.save_upload(candidate)
+    finally:
+        thesis_file.close()
+    discard_upload_session(upload_session)
+    return JsonResponse({'redirect': reverse('candidate_home')})
+
+
 @login_required
 def candidate_metadata(request):
     from .forms import MetadataForm
@@ -221,14 +305,71 @@ def staff_home(request):
     return HttpResponseRedirect(reverse('review_candidates', kwargs={'status': 'all'}))
 
 
+def _get_paging_params(request):
+    page_size = min(max(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    after = int(request.GET.get('after', 0))
+    return page_size, after
+
+
 @login_required
 @permission_required('etd_app.change_candidate', raise_exception=True)
 def staff_view_candidates(request, status):
-    if 'sort_by' in request.GET:
-        candidates = Candidate.get_candidates_by_status(status, sort_param=request.GET['sort_by'])
-    else:
-        candidates = Candidate.get_candidates_by_status(status)
-    return render(request, 'etd_app/staff_view_candidates.html', {'candidates': candidates, 'status': status})
+    sort_by = request.GET.get('sort_by', '')
+    try:
+        page_size, after = _get_paging_params(request)
+    except ValueError:
+        return HttpResponseBadRequest('invalid page_size or after parameter')
+    try:
+        candidates, next_after = Candidate.get_candidates_page(status, sort_param=sort_by, after=after, page_size=page_size)
+    except CandidateException as ce:
+        return HttpResponseBadRequest('%s' % ce)
+    context = {'candidates': candidates, 'status': status, 'sort_by': sort_by,
+               'page_size': page_size, 'after': after, 'next_after': next_after,
+               'status_counts': CandidateSummary.get_cached_status_counts()}
+    return render(request, 'etd_app/staff_view_candidates.html', context)
+
+
+@login_required
+@permission_required('etd_app.change_candidate', raise_exception=True)
+def staff_export_candidates(request, status):
+    from .export import get_export_rows, EXPORT_FORMATS
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('invalid format: %s' % export_format)
+    lines_func, content_type = EXPORT_FORMATS[export_format]
+    rows = get_export_rows(status, sort_param=request.GET.get('sort_by', ''))
+    response = StreamingHttpResponse(lines_func(rows), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="candidates_%s.%s"' % (status, export_format)
+    return response
+
+
+@login_required
+@permission_required('etd_app.change_candidate', raise_exception=True)
+def staff_search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page_size, after = _get_paging_params(request)
+    except ValueError:
+        return HttpResponseBadRequest('invalid page_size or after parameter')
+    try:
+        candidates, next_after = Candidate.search(query, after=after, page_size=page_size)
+    except CandidateException as ce:
+        return HttpResponseBadRequest('%s' % ce)
+    context = {'candidates': candidates, 'query': query, 'page_size': page_size, 'after': after,
+               'next_after': next_after, 'status_counts': CandidateSummary.get_cached_status_counts()}
+    return render(request, 'etd_app/staff_search.html', context)
+
+
+def _status_counts_etag(request):
+    counts = CandidateSummary.get_cached_status_counts()
+    return hashlib.md5(json.dumps(counts, sort_keys=True)).hexdigest()
+
+
+@login_required
+@permission_required('etd_app.change_candidate', raise_exception=True)
+@etag(_status_counts_etag)
+def staff_status_counts(request):
+    return JsonResponse(CandidateSummary.get_cached_status_counts())
 
 
 @login_required
@@ -269,21 +410,20 @@ def staff_format_post(request, candidate_id):
 @login_required
 def view_file(request, candidate_id):
     candidate = get_object_or_404(Candidate, id=candidate_id)
-    file_path = os.path.join(settings.MEDIA_ROOT, candidate.thesis.current_file_name)
-    response = FileResponse(open(file_path, 'rb'), content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="%s"' % candidate.thesis.original_file_name
-    return response
+    thesis = candidate.thesis
+    return file_serving.serve_file(request, thesis.document.name, 'application/pdf', thesis.original_file_name,
+            etag=thesis.checksum, last_modified=thesis.modified, storage=thesis.document.storage)
 
 
 def _select2_list(search_results):
     select2_results = []
-    for r in search_results:
-        select2_results.append({'id': r.id, 'text': r.text})
+    for keyword_id, text in search_results:
+        select2_results.append({'id': keyword_id, 'text': text})
     return select2_results
 
 
 def _get_previously_used(model, term):
-    keywords = Keyword.search(term=term, order='text')
+    keywords = Keyword.suggest(term)
     if len(keywords) > 0:
         return [{'text': 'Previously Used', 'children': _select2_list(keywords)}]
     else:
@@ -296,6 +436,9 @@ def _build_fast_url(term, index):
     return url
 
 
+FAST_ERROR_RESPONSE = [{'text': 'FAST results', 'children': [{'id': '', 'text': 'Error retrieving FAST results.'}]}]
+
+
 def _fast_results_to_select2_list(fast_results, index):
     results = []
     fast_ids = []
@@ -309,33 +452,140 @@ def _fast_results_to_select2_list(fast_results, index):
     return results
 
 
-def _get_fast_results(term, index='suggestall'):
-    error_response = [{'text': 'FAST results', 'children': [{'id': '', 'text': 'Error retrieving FAST results.'}]}]
+def _get_fast_results(term, index='suggestall', timeout=fast.DEFAULT_LOOKUP_TIMEOUT):
+    results_cache = fast.get_results_cache()
+    results = results_cache.get(term, index)
+    if results is None:
+        #if another thread is already looking up the same term, wait for its results instead
+        key = (index, fast.normalize_term(term))
+        try:
+            results = fast.get_single_flight().do(key, lambda: _fetch_fast_results(results_cache, term, index, timeout))
+        except fast.FastCircuitOpen:
+            #FAST has been failing - leave out the FAST results (without an error) until it's back
+            return []
+    return results
+
+
+def _fetch_fast_results(results_cache, term, index, timeout):
+    have_lock = results_cache.acquire_lock(term, index, timeout)
+    if not have_lock:
+        #another process is looking up this term - use its results if they come back in time
+        results = results_cache.wait_for_results(term, index, timeout)
+        if results is not None:
+            return results
+    try:
+        results = _lookup_fast_results(term, index, timeout)
+        if results is not FAST_ERROR_RESPONSE:
+            results_cache.set(term, index, results)
+        return results
+    finally:
+        if have_lock:
+            results_cache.release_lock(term, index)
+
+
+def _lookup_fast_results(term, index, timeout=fast.DEFAULT_LOOKUP_TIMEOUT):
+    error_response = FAST_ERROR_RESPONSE
     url = _build_fast_url(term, index)
     try:
-        r = requests.get(url, timeout=2)
-    except requests.exceptions.Timeout:
-        logger.error('fast lookup timed out')
-        return error_response
-    except Exception:
-        import traceback
-        logger.error('fast lookup exception: %s' % traceback.format_exc())
+        data = fast.get_client().get_json(url, timeout=timeout)
+    except fast.FastCircuitOpen:
+        raise
+    except fast.FastLookupError as e:
+        logger.error('fast lookup error: %s' % e)
         return error_response
     try:
-        select2_results = _fast_results_to_select2_list(r.json()['response']['docs'], index)
+        select2_results = _fast_results_to_select2_list(data['response']['docs'], index)
         if select2_results:
             return [{'text': 'FAST results', 'children': select2_results}]
         else:
             return []
     except Exception as e:
         logger.error('fast data exception: %s' % e)
-        logger.error('fast response: %s - %s' % (r.status_code, r.text))
+        logger.error('fast response: %s' % data)
         return error_response
 
 
+def _start_fast_lookups(term, indexes, timeout):
+    '''Start a thread for each FAST index lookup. Returns the threads and the dict that each
+    thread puts its index's results in when it's done.'''
+    results = {}
+
+    def lookup(index):
+        results[index] = _get_fast_results(term, index, timeout=timeout)
+
+    threads = []
+    for index in indexes:
+        thread = threading.Thread(target=lookup, args=(index,))
+        thread.daemon = True
+        thread.start()
+        threads.append((index, thread))
+    return threads, results
+
+
+def _finish_fast_lookups(threads, results, deadline):
+    '''Wait (until the deadline at most) for the lookup threads, & return the results in index order.
+    An index that hasn't finished in time counts as an error, but doesn't hold up the others.'''
+    index_results = []
+    for index, thread in threads:
+        thread.join(max(deadline - time.time(), 0))
+        if index in results:
+            index_results.append(results[index])
+        else:
+            logger.error('fast lookup (%s) missed the deadline' % index)
+            index_results.append(FAST_ERROR_RESPONSE)
+    return index_results
+
+
+def _merge_fast_results(index_results):
+    '''Combine the results from multiple FAST indexes into one group, dropping repeats of the same
+    FAST id. Only return the error response if there are no results & some index failed.'''
+    children = []
+    fast_ids = []
+    error = False
+    for results in index_results:
+        if results is FAST_ERROR_RESPONSE:
+            error = True
+            continue
+        for group in results:
+            for item in group['children']:
+                fast_id = item['id'].split(ID_VAL_SEPARATOR)[0]
+                if fast_id not in fast_ids:
+                    children.append(item)
+                    fast_ids.append(fast_id)
+    if children:
+        return [{'text': 'FAST results', 'children': children}]
+    elif error:
+        return FAST_ERROR_RESPONSE
+    else:
+        return []
+
+
+def _get_local_fast_results(term):
+    #FAST headings from the FastSubject table, in the same format as the FAST lookup results
+    results = []
+    for fast_id, heading, label in FastSubject.search(term):
+        text = heading
+        if label != heading:
+            text = '%s (%s)' % (heading, label)
+        results.append({'id': '%s%s%s' % (fast_id, ID_VAL_SEPARATOR, heading), 'text': text})
+    if results:
+        return [{'text': 'FAST results', 'children': results}]
+    else:
+        return []
+
+
 @login_required
 def autocomplete_keywords(request):
     term = request.GET['term']
+    if getattr(settings, 'FAST_LOCAL_AUTHORITY', False):
+        results = _get_previously_used(Keyword, term)
+        results.extend(_get_local_fast_results(term))
+        return JsonResponse({'err': 'nil', 'results': results})
+    #the FAST lookups run in the background while we search the local keywords, so the response
+    #  takes as long as the slowest source (capped by the timeout), not all of them added together
+    timeout = getattr(settings, 'FAST_LOOKUP_TIMEOUT', fast.DEFAULT_LOOKUP_TIMEOUT)
+    deadline = time.time() + timeout
+    threads, fast_results = _start_fast_lookups(term, fast.get_lookup_indexes(), timeout)
     results = _get_previously_used(Keyword, term)
-    results.extend(_get_fast_results(term))
+    results.extend(_merge_fast_results(_finish_fast_lookups(threads, fast_results, deadline)))
     return JsonResponse({'err': 'nil', 'results': results})
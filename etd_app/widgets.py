@@ -1,7 +1,8 @@
 from __future__ import unicode_literals
+from django.conf import settings
 from django.forms.widgets import SelectMultiple
 from django.utils.encoding import force_text
-from .models import Keyword
+from .models import Keyword, FastSubject
 
 
 ID_VAL_SEPARATOR = '\t'
@@ -12,37 +13,35 @@ class KeywordSelect2TagWidget(SelectMultiple):
 
     queryset = Keyword.objects.all()
 
-    def _get_value_text(self, value):
-        #from the widget value, get the string that would go in the Keyword.text field
-        if ID_VAL_SEPARATOR in value:
-            value = value.split(ID_VAL_SEPARATOR, 1)[1]
-        return Keyword.normalize_text(value)
-
-    def _create_new_keyword(self, value):
+    def _new_keyword(self, value, fast_headings):
+        #an unsaved Keyword for a value the user typed, or picked from the FAST results
         if ID_VAL_SEPARATOR in value:
             fast_id, kw_text = value.split(ID_VAL_SEPARATOR, 1)
+            #use the heading from our copy of FAST if we have one, in case the submitted text was changed
+            kw_text = fast_headings.get(fast_id, kw_text)
             fast_id = fast_id.replace('fst', '')
-            return self.queryset.create(text=kw_text, authority='fast',
-                    authority_uri=FAST_URI, value_uri='%s/%s' % (FAST_URI, fast_id))
+            return Keyword(text=kw_text, authority='fast', authority_uri=FAST_URI, value_uri='%s/%s' % (FAST_URI, fast_id))
         else:
-            return self.queryset.create(text=value)
+            return Keyword(text=value)
+
+    def _get_fast_headings(self, values):
+        if not getattr(settings, 'FAST_LOCAL_AUTHORITY', False):
+            return {}
+        fast_ids = [val.split(ID_VAL_SEPARATOR, 1)[0] for val in values if ID_VAL_SEPARATOR in val]
+        if not fast_ids:
+            return {}
+        return dict(FastSubject.objects.filter(fast_id__in=fast_ids).values_list('fast_id', 'heading'))
 
     def value_from_datadict(self, data, files, field_name):
         values = super(KeywordSelect2TagWidget, self).value_from_datadict(data, files, field_name)
+        values = [val for val in values if val]
+        #numbers are ids of keywords that are already in the db; anything else is text (maybe with a
+        #  FAST id) that could be new, or could be in the db already (eg. composed instead of decomposed)
+        text_values = [val for val in values if not val.isdigit()]
+        fast_headings = self._get_fast_headings(text_values)
+        keywords = Keyword.get_or_create_all([self._new_keyword(val, fast_headings) for val in text_values])
+        keyword_ids = dict(zip(text_values, [keyword.id for keyword in keywords]))
         cleaned_values = []
-        for val in [val for val in values if val]:
-            try:
-                qs = self.queryset.filter(**{'pk__in': val})
-                cleaned_values.append(val)
-            except ValueError:
-                #val is some text the user just typed
-                #it might be in the db already, just not found because it's composed instead of decomposed
-                kw_text = self._get_value_text(val)
-                try:
-                    found_keyword = self.queryset.get(text=kw_text)
-                    #we found the keyword, so add this id to cleaned_values
-                    cleaned_values.append(found_keyword.id)
-                except Keyword.DoesNotExist:
-                    created_keyword = self._create_new_keyword(val)
-                    cleaned_values.append(created_keyword.id)
+        for val in values:
+            cleaned_values.append(keyword_ids.get(val, val))
         return cleaned_values
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import io
+import os
+from django.core.files import File
+from django.test import SimpleTestCase
+from etd_app.checksums import calculate_digests, file_digest, file_digests, Throttle
+
+
+TEST_PDF_SHA1 = 'b1938fc5549d1b5b42c0b695baa76d5df5f81ac3'
+TEST_PDF_SHA256 = '0b177d263a8ee3d6416ac251e8b208e53905e3bb4d8889ff2d49dfdb9b294c8e'
+TEST_PDF_MD5 = '9c4fb1b76dbe004bfcc82c2cf9417a03'
+
+
+class TestCalculateDigests(SimpleTestCase):
+
+    def setUp(self):
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files', 'test.pdf')
+
+    def test_django_file(self):
+        with open(self.path, 'rb') as f:
+            django_file = File(f)
+            django_file.read(10)
+            digests = calculate_digests(django_file, ['sha1', 'sha256', 'md5'], chunk_size=100)
+            self.assertEqual(digests, {'sha1': TEST_PDF_SHA1, 'sha256': TEST_PDF_SHA256, 'md5': TEST_PDF_MD5})
+            #file is back at the beginning
+            self.assertEqual(django_file.read(5), b'%PDF-')
+
+    def test_plain_file(self):
+        with io.open(self.path, 'rb') as f:
+            self.assertEqual(calculate_digests(f, chunk_size=7), {'sha1': TEST_PDF_SHA1})
+
+
+class TestFileDigests(SimpleTestCase):
+
+    def setUp(self):
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files', 'test.pdf')
+
+    def test_file_digest(self):
+        self.assertEqual(file_digest(self.path, buffer_size=100), TEST_PDF_SHA1)
+        self.assertEqual(file_digest(self.path, 'sha256'), TEST_PDF_SHA256)
+
+    def test_file_digests(self):
+        missing_path = os.path.join(os.path.dirname(self.path), 'missing.pdf')
+        for workers in [1, 2]:
+            results = dict((path, (digest, error)) for path, digest, error in file_digests([self.path, missing_path], workers=workers))
+            self.assertEqual(results[self.path], (TEST_PDF_SHA1, ''))
+            self.assertEqual(results[missing_path][0], '')
+            self.assertIn('No such file', results[missing_path][1])
+
+    def test_throttle(self):
+        now = [100.0]
+        sleeps = []
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        throttle = Throttle(1000, clock=lambda: now[0], sleep=sleep)
+        throttle.consumed(500)
+        now[0] += 0.2
+        throttle.consumed(500)
+        self.assertEqual(len(sleeps), 2)
+        self.assertAlmostEqual(sleeps[0], 0.5)
+        self.assertAlmostEqual(sleeps[1], 0.3)
+        #no limit
+        Throttle(None, sleep=sleep).consumed(10 ** 9)
+        self.assertEqual(len(sleeps), 2)
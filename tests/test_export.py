@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import csv
+import json
+import os
+import tempfile
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from tests.test_models import LAST_NAME, FIRST_NAME, complete_gradschool_checklist
+from tests.test_views import CandidateCreator
+from etd_app.export import get_export_rows, csv_lines, json_lines, EXPORT_COLUMNS
+from etd_app.models import Thesis
+
+
+class TestExport(TestCase, CandidateCreator):
+
+    def setUp(self):
+        self._create_candidate()
+        self.candidate.thesis.title = 'tëst'
+        self.candidate.thesis.status = Thesis.STATUS_CHOICES.accepted
+        self.candidate.thesis.save()
+        complete_gradschool_checklist(self.candidate)
+
+    def test_export_rows(self):
+        with self.assertNumQueries(1):
+            rows = list(get_export_rows('complete'))
+        self.assertEqual(len(rows), 1)
+        row = dict(zip(EXPORT_COLUMNS, rows[0]))
+        self.assertEqual(row['netid'], 'tjones@brown.edu')
+        self.assertEqual(row['last_name'], LAST_NAME)
+        self.assertEqual(row['title'], 'tëst')
+        self.assertEqual(row['thesis_status'], 'accepted')
+        self.assertEqual(row['bursar_receipt'].date(), timezone.now().date())
+        self.assertEqual(list(get_export_rows('in_progress')), [])
+
+    def test_csv(self):
+        lines = list(csv_lines(get_export_rows('all')))
+        self.assertEqual(len(lines), 2)
+        rows = list(csv.reader(lines))
+        self.assertEqual(rows[0], [str(column) for column in EXPORT_COLUMNS])
+        self.assertEqual(rows[1][2].decode('utf8'), LAST_NAME)
+        self.assertEqual(rows[1][EXPORT_COLUMNS.index('pid')], '')
+
+    def test_json(self):
+        data = json.loads(''.join(json_lines(get_export_rows('all'))))
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['first_name'], FIRST_NAME)
+        self.assertEqual(data[0]['department'], 'Engineering')
+        self.assertEqual(json.loads(''.join(json_lines(get_export_rows('in_progress')))), [])
+
+    def test_export_command(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            call_command('export_candidates', status='complete', export_format='json', output=path)
+            with open(path, 'rb') as f:
+                data = json.loads(f.read().decode('utf8'))
+        finally:
+            os.remove(path)
+        self.assertEqual(data[0]['title'], 'tëst')
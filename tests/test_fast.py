@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import threading
+import time
+from django.test import SimpleTestCase
+from etd_app.fast import (FastResultsCache, FastClient, SingleFlight, FastLookupError, FastCircuitOpen, get_results_cache, normalize_term,
+        iter_marcxml_subjects, iter_ntriples_subjects)
+from .test_models import COMPOSED_TEXT, DECOMPOSED_TEXT
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFastResultsCache(SimpleTestCase):
+
+    def test_normalize_term(self):
+        self.assertEqual(normalize_term(' Climate   Change '), 'climate change')
+        self.assertEqual(normalize_term(COMPOSED_TEXT), normalize_term(DECOMPOSED_TEXT))
+
+    def test_get_set(self):
+        cache = FastResultsCache()
+        self.assertEqual(cache.get('clim', 'suggestall'), None)
+        cache.set('clim', 'suggestall', [])
+        self.assertEqual(cache.get('CLIM ', 'suggestall'), [])
+        self.assertEqual(cache.get('clim', 'suggest50'), None)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = FastResultsCache(ttl=60, clock=clock)
+        cache.set('clim', 'suggestall', ['results'])
+        clock.now += 59
+        self.assertEqual(cache.get('clim', 'suggestall'), ['results'])
+        clock.now += 2
+        self.assertEqual(cache.get('clim', 'suggestall'), None)
+
+    def test_lru(self):
+        cache = FastResultsCache(max_entries=2)
+        cache.set('a', 'suggestall', ['a'])
+        cache.set('b', 'suggestall', ['b'])
+        cache.get('a', 'suggestall') #now b is the least recently used
+        cache.set('c', 'suggestall', ['c'])
+        self.assertEqual(cache.get('a', 'suggestall'), ['a'])
+        self.assertEqual(cache.get('b', 'suggestall'), None)
+        self.assertEqual(cache.get('c', 'suggestall'), ['c'])
+
+    def test_django_cache_backend(self):
+        cache = FastResultsCache(backend='default')
+        cache.set('clim change', 'suggestall', ['results'])
+        self.assertEqual(FastResultsCache(backend='default').get('Clim Change', 'suggestall'), ['results'])
+        cache.clear()
+        self.assertEqual(cache.get('clim change', 'suggestall'), None)
+
+    def test_get_results_cache_settings(self):
+        with self.settings(FAST_CACHE_TTL=10, FAST_CACHE_MAX_ENTRIES=3):
+            cache = get_results_cache()
+            self.assertEqual(cache.ttl, 10)
+            self.assertEqual(cache.max_entries, 3)
+            self.assertTrue(get_results_cache() is cache)
+        self.assertFalse(get_results_cache() is cache)
+
+
+class FakeResponse(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.urls = []
+        self.error = None
+
+    def get(self, url, timeout):
+        self.urls.append(url)
+        if self.error:
+            raise self.error
+        return FakeResponse({'url': url})
+
+
+class TestFastClient(SimpleTestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.clock = FakeClock()
+        self.client = FastClient(failure_threshold=2, recovery_timeout=30, session=self.session, clock=self.clock)
+
+    def test_get_json(self):
+        self.assertEqual(self.client.get_json('http://fast/1', timeout=1), {'url': 'http://fast/1'})
+        self.session.error = IOError('connection refused')
+        with self.assertRaises(FastLookupError):
+            self.client.get_json('http://fast/2')
+        self.assertFalse(self.client.is_open)
+
+    def test_circuit_breaker(self):
+        self.session.error = IOError('connection refused')
+        for i in range(2):
+            with self.assertRaises(FastLookupError):
+                self.client.get_json('http://fast/1')
+        self.assertTrue(self.client.is_open)
+        #while the circuit's open, FAST isn't called
+        with self.assertRaises(FastCircuitOpen):
+            self.client.get_json('http://fast/2')
+        self.assertEqual(len(self.session.urls), 2)
+        #after the recovery timeout, a failed probe keeps the circuit open
+        self.clock.now += 31
+        with self.assertRaises(FastCircuitOpen):
+            self.client.get_json('http://fast/3')
+        self.client._probe_thread.join()
+        self.assertEqual(self.session.urls[-1], 'http://fast/3')
+        self.assertTrue(self.client.is_open)
+        #& a successful probe closes it
+        self.clock.now += 31
+        self.session.error = None
+        with self.assertRaises(FastCircuitOpen):
+            self.client.get_json('http://fast/4')
+        self.client._probe_thread.join()
+        self.assertFalse(self.client.is_open)
+        self.assertEqual(self.client.get_json('http://fast/5'), {'url': 'http://fast/5'})
+
+    def test_circuit_closes_before_probe(self):
+        self.session.error = IOError('connection refused')
+        for i in range(2):
+            with self.assertRaises(FastLookupError):
+                self.client.get_json('http://fast/1')
+        #a probe in another thread succeeds after this lookup saw the circuit open
+        self.session.error = None
+        self.client._record_success()
+        self.assertFalse(self.client._start_probe('http://fast/2', 1))
+        self.assertEqual(self.client._probe_thread, None)
+
+
+class TestSingleFlight(SimpleTestCase):
+
+    def test_concurrent_calls_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            release.wait(5)
+            return ['results']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('clim', lookup))) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.01)
+        time.sleep(0.1) #give the other threads time to start waiting
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [['results']] * 3)
+        #once the call's finished, the next one runs again
+        self.assertEqual(single_flight.do('clim', lambda: ['new results']), ['new results'])
+
+    def test_exception(self):
+        def lookup():
+            raise FastLookupError('down')
+        with self.assertRaises(FastLookupError):
+            SingleFlight().do('clim', lookup)
+
+
+class TestCacheLock(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = FastResultsCache(backend='default', lock=True)
+        self.cache.clear()
+
+    def test_lock(self):
+        self.assertTrue(self.cache.acquire_lock('clim', 'suggestall', 2))
+        self.assertFalse(self.cache.acquire_lock('Clim', 'suggestall', 2))
+        self.assertTrue(self.cache.acquire_lock('clim', 'suggest50', 2))
+        self.cache.release_lock('clim', 'suggestall')
+        self.assertTrue(self.cache.acquire_lock('clim', 'suggestall', 2))
+        #without a django cache, there's no locking
+        self.assertTrue(FastResultsCache(lock=True).acquire_lock('clim', 'suggestall', 2))
+
+    def test_wait_for_results(self):
+        self.cache.acquire_lock('clim', 'suggestall', 2)
+        def other_process():
+            time.sleep(0.1)
+            self.cache.set('clim', 'suggestall', ['results'])
+            self.cache.release_lock('clim', 'suggestall')
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        self.assertEqual(self.cache.wait_for_results('clim', 'suggestall', 2), ['results'])
+        thread.join()
+        #if the lock goes away without any results, stop waiting
+        self.assertEqual(self.cache.wait_for_results('other', 'suggestall', 2), None)
+
+
+class TestSubjectFileParsers(SimpleTestCase):
+
+    def _get_path(self, filename):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files', filename)
+
+    def test_marcxml(self):
+        with open(self._get_path('fast_subjects.xml'), 'rb') as f:
+            subjects = list(iter_marcxml_subjects(f))
+        self.assertEqual(subjects, [
+                ('fst01084736', 'Python (Computer program language)', ['Python (Programming language)']),
+                ('fst00903014', 'Education--History', []),
+                ('fst00940388', 'Réunion', []),
+            ])
+
+    def test_ntriples(self):
+        with open(self._get_path('fast_subjects.nt'), 'rb') as f:
+            subjects = list(iter_ntriples_subjects(f))
+        self.assertEqual(subjects, [
+                ('fst01084736', 'Python (Computer program language)', ['Python (Programming language)']),
+                ('fst00903014', 'Education--History', []),
+                ('fst00940388', 'Réunion', ['Bourbon "Island"']),
+            ])
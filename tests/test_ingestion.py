@@ -4,9 +4,10 @@ import datetime
 from django.test import TestCase
 
 from etd_app.mods_mapper import ModsMapper
+from etd_app import ingestion
 from etd_app.ingestion import ThesisIngester
 from etd_app.models import Keyword
-from tests.test_models import LAST_NAME, FIRST_NAME, add_metadata_to_thesis
+from tests.test_models import LAST_NAME, FIRST_NAME, add_file_to_thesis, add_metadata_to_thesis
 from tests.test_views import CandidateCreator
 
 
@@ -53,15 +54,16 @@ class TestModsMapper(TestCase, CandidateCreator):
         self.assertEqual(mods.languages[0].terms[0].authority, 'iso639-2b')
 
 
+class FakeResponse(object):
+    ok = True
+
+    def json(self):
+        return {'pid': 'test:1234'}
+
+
 class TestIngestion(TestCase, CandidateCreator):
 
-    def test_status(self):
-        self._create_candidate()
-        with self.assertRaises(Exception) as cm:
-            ThesisIngester(self.candidate.thesis)
-        #make sure we can create the ThesisIngester if we complete the thesis/checklist
-        self.candidate.thesis.status = 'accepted'
-        self.candidate.thesis.save()
+    def _complete_checklist(self):
         now = datetime.datetime.now()
         self.candidate.gradschool_checklist.dissertation_fee = now
         self.candidate.gradschool_checklist.bursar_receipt = now
@@ -69,4 +71,36 @@ class TestIngestion(TestCase, CandidateCreator):
         self.candidate.gradschool_checklist.earned_docs_survey = now
         self.candidate.gradschool_checklist.pages_submitted_to_gradschool = now
         self.candidate.gradschool_checklist.save()
+
+    def test_status(self):
+        self._create_candidate()
+        with self.assertRaises(Exception) as cm:
+            ThesisIngester(self.candidate.thesis)
+        #make sure we can create the ThesisIngester if we complete the thesis/checklist
+        self.candidate.thesis.status = 'accepted'
+        self.candidate.thesis.save()
+        self._complete_checklist()
+        ti = ThesisIngester(self.candidate.thesis)
+
+    def test_post_to_api(self):
+        self._create_candidate()
+        add_file_to_thesis(self.candidate.thesis)
+        self.candidate.thesis.status = 'accepted'
+        self.candidate.thesis.save()
+        self._complete_checklist()
         ti = ThesisIngester(self.candidate.thesis)
+        #the repository gets the uploaded file name, not the checksum name it's stored under
+        self.assertEqual(ti.get_content_param(), '[{"file_name": "test.pdf"}]')
+        posted = {}
+        def fake_post(url, data, files):
+            posted.update(dict((name, f.read()) for name, f in files.items()))
+            return FakeResponse()
+        real_post = ingestion.requests.post
+        ingestion.requests.post = fake_post
+        try:
+            with self.settings(API_URL='http://localhost/api/'):
+                self.assertEqual(ti.post_to_api({}), 'test:1234')
+        finally:
+            ingestion.requests.post = real_post
+        with open(self.candidate.thesis.file_path, 'rb') as f:
+            self.assertEqual(posted, {'test.pdf': f.read()})
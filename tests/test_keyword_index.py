@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import threading
+from django.test import SimpleTestCase
+from etd_app import keyword_index
+from etd_app.keyword_index import KeywordIndex
+from etd_app.models import Keyword
+
+
+class TestKeywordIndex(SimpleTestCase):
+
+    def setUp(self):
+        self.index = KeywordIndex([
+                (1, 'Climate change', 'climate change', 0),
+                (2, 'Climate', 'climate', 0),
+                (3, 'Global climate models', 'global climate models', 0),
+                (4, 'Clinical trials', 'clinical trials', 0),
+                (5, 'Zebra', 'zebra', 0),
+            ])
+
+    def test_ranking(self):
+        #exact match, then keywords starting with the term, then later words
+        self.assertEqual(self.index.search('climate'), [(2, 'Climate'), (1, 'Climate change'), (3, 'Global climate models')])
+        self.assertEqual([r[0] for r in self.index.search('cli')], [2, 1, 4, 3])
+
+    def test_usage_count_ranking(self):
+        #more-used keywords come first, but only within the same kind of match
+        self.index.set_usage_count(3, 10)
+        self.index.set_usage_count(4, 5)
+        self.assertEqual([r[0] for r in self.index.search('cli')], [4, 2, 1, 3])
+        self.index.add(6, 'Climate change--Economic aspects', 'climate change--economic aspects', 20)
+        self.assertEqual([r[0] for r in self.index.search('climate')], [2, 6, 1, 3])
+
+    def test_word_prefix_only(self):
+        self.assertEqual(self.index.search('mate'), [])
+        self.assertEqual(self.index.search('climate x'), [])
+        self.assertEqual(self.index.search('climate  mod'), [(3, 'Global climate models')])
+        self.assertEqual(self.index.search(' '), [])
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('c', limit=2), [(2, 'Climate'), (1, 'Climate change')])
+
+    def test_add_remove(self):
+        self.index.add(6, 'Zebrafish', 'zebrafish')
+        self.assertEqual([r[0] for r in self.index.search('zeb')], [5, 6])
+        #re-adding an id replaces its old entries
+        self.index.add(5, 'Zoology', 'zoology')
+        self.assertEqual([r[0] for r in self.index.search('zeb')], [6])
+        self.index.remove(6)
+        self.index.remove(6)
+        self.assertEqual(self.index.search('zeb'), [])
+        self.assertEqual(len(self.index), 5)
+
+
+class TestGetIndex(SimpleTestCase):
+
+    def setUp(self):
+        self._load_index = keyword_index._load_index
+        keyword_index.reset_index()
+
+    def tearDown(self):
+        keyword_index._load_index = self._load_index
+        keyword_index.reset_index()
+
+    def test_reload_in_background(self):
+        keyword_index._load_index = lambda: KeywordIndex([(1, 'Climate', 'climate', 0)])
+        old_index = keyword_index.get_index()
+        started = threading.Event()
+        finish = threading.Event()
+        def slow_load():
+            started.set()
+            finish.wait(5)
+            return KeywordIndex([(2, 'Zebra', 'zebra', 0)])
+        keyword_index._load_index = slow_load
+        reloaded = []
+        with self.settings(KEYWORD_INDEX_MAX_AGE=-1):
+            thread = threading.Thread(target=lambda: reloaded.append(keyword_index.get_index()))
+            thread.start()
+            started.wait(5)
+            #other threads keep using the old index while it's reloading
+            self.assertIs(keyword_index.get_index(), old_index)
+            #& changes made meanwhile go in the new index too
+            keyword_index.keyword_saved(Keyword(id=3, text='Zebrafish', search_text='zebrafish'))
+            finish.set()
+            thread.join()
+        self.assertIsNot(reloaded[0], old_index)
+        self.assertIs(keyword_index._index, reloaded[0])
+        self.assertEqual([r[0] for r in reloaded[0].search('zeb')], [2, 3])
+        self.assertEqual([r[0] for r in old_index.search('zeb')], [3])
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
-from datetime import date
+from datetime import date, timedelta
 import os
+import time
+from StringIO import StringIO
+from django.conf import settings
 from django.core.files import File
+from django.core.management import call_command
 from django.db import IntegrityError
 from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
+from etd_app import keyword_index
+from tests.test_checksums import TEST_PDF_SHA1, TEST_PDF_SHA256, TEST_PDF_MD5
 from etd_app.models import (
         Person,
         DuplicateNetidException,
@@ -16,13 +22,16 @@ from etd_app.models import (
         Degree,
         CandidateException,
         Candidate,
+        CandidateSummary,
         GradschoolChecklist,
         CommitteeMemberException,
         CommitteeMember,
         KeywordException,
         Keyword,
+        FastSubject,
         ThesisException,
         Thesis,
+        FixityCheck,
     )
 
 
@@ -289,6 +298,67 @@ class TestCandidate(TransactionTestCase):
         self.assertEqual(len(complete), 1)
         self.assertEqual(complete[0].person.netid, 'bjohnson@brown.edu')
 
+    def test_get_candidates_paperwork_status_by_degree_type(self):
+        masters = Degree.objects.create(abbreviation='MS', name='Masters', degree_type=Degree.TYPES.masters)
+        p = Person.objects.create(netid='tjones@brown.edu', last_name=LAST_NAME, email='tom_jones@brown.edu')
+        p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='smith', email='r_smith@brown.edu')
+        c = Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        c2 = Candidate.objects.create(person=p2, year=2016, department=self.dept, degree=masters)
+        for candidate in [c, c2]:
+            candidate.thesis.status = Thesis.STATUS_CHOICES.accepted
+            candidate.thesis.save()
+            #bursar receipt & signature pages are enough for masters, but not for doctorate
+            candidate.gradschool_checklist.bursar_receipt = timezone.now()
+            candidate.gradschool_checklist.pages_submitted_to_gradschool = timezone.now()
+            candidate.gradschool_checklist.save()
+        with self.assertNumQueries(1):
+            complete = list(Candidate.get_candidates_by_status('complete'))
+        self.assertEqual([cand.id for cand in complete], [c2.id])
+        with self.assertNumQueries(1):
+            paperwork_incomplete = list(Candidate.get_candidates_by_status('paperwork_incomplete'))
+        self.assertEqual([cand.id for cand in paperwork_incomplete], [c.id])
+
+    def test_get_candidates_listing_fields(self):
+        p = Person.objects.create(netid='tjones@brown.edu', last_name=LAST_NAME, first_name=FIRST_NAME, email='tom_jones@brown.edu')
+        p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='smith', email='r_smith@brown.edu')
+        Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        Candidate.objects.create(person=p2, year=2016, department=self.dept, degree=self.degree)
+        #everything the staff listing displays should come back in the one query
+        with self.assertNumQueries(1):
+            for candidate in Candidate.get_candidates_by_status('all'):
+                summary = candidate.summary
+                row = (summary.last_name, summary.first_name, summary.department_name,
+                       summary.get_thesis_status_display(), summary.title,
+                       summary.date_registered, summary.date_submitted)
+        self.assertEqual(row[0], 'smith')
+
+    def test_summary_follows_person_and_department(self):
+        p = Person.objects.create(netid='tjones@brown.edu', last_name=LAST_NAME, email='tom_jones@brown.edu')
+        c = Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        p.last_name = 'Smith'
+        p.first_name = 'Sam'
+        p.save()
+        self.dept.name = 'Applied Engineering'
+        self.dept.save()
+        summary = CandidateSummary.objects.get(candidate=c)
+        self.assertEqual((summary.last_name, summary.first_name, summary.department_name), ('Smith', 'Sam', 'Applied Engineering'))
+        self.assertEqual(Candidate.get_candidates_by_status('all', sort_param='department')[0].summary.department_name, 'Applied Engineering')
+
+    def test_summary_follows_degree_type(self):
+        p = Person.objects.create(netid='tjones@brown.edu', last_name=LAST_NAME, email='tom_jones@brown.edu')
+        c = Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        c.thesis.status = Thesis.STATUS_CHOICES.accepted
+        c.thesis.save()
+        now = timezone.now()
+        c.gradschool_checklist.bursar_receipt = now
+        c.gradschool_checklist.pages_submitted_to_gradschool = now
+        c.gradschool_checklist.save()
+        self.assertEqual(CandidateSummary.objects.get(candidate=c).workflow_status, CandidateSummary.WORKFLOW_STATUSES.paperwork_incomplete)
+        #masters candidates don't need the rest of the doctoral paperwork
+        self.degree.degree_type = Degree.TYPES.masters
+        self.degree.save()
+        self.assertEqual(CandidateSummary.objects.get(candidate=c).workflow_status, CandidateSummary.WORKFLOW_STATUSES.complete)
+
     def test_candidates_by_status_sorted(self):
         p = Person.objects.create(netid='tjones@brown.edu', last_name=LAST_NAME, email='tom_jones@brown.edu')
         p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='Smith', email='r_smith@brown.edu')
@@ -308,6 +378,162 @@ class TestCandidate(TransactionTestCase):
         self.assertEqual(sorted_candidates[0].thesis.title, 'aaaa')
 
 
+    def _page_through(self, status, sort_param, page_size):
+        ids = []
+        after = None
+        while True:
+            candidates, after = Candidate.get_candidates_page(status, sort_param=sort_param, after=after, page_size=page_size)
+            ids.extend([c.id for c in candidates])
+            if not after:
+                return ids
+
+    def test_candidates_multi_key_sort(self):
+        dept2 = Department.objects.create(name='Anthropology')
+        p = Person.objects.create(netid='tjones@brown.edu', last_name='Jones', email='tom_jones@brown.edu')
+        p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='Smith', email='r_smith@brown.edu')
+        p3 = Person.objects.create(netid='bjohnson@brown.edu', last_name='Johnson', email='bob_johnson@brown.edu')
+        c = Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        c2 = Candidate.objects.create(person=p2, year=2016, department=dept2, degree=self.degree)
+        c3 = Candidate.objects.create(person=p3, year=2016, department=self.dept, degree=self.degree)
+        sorted_candidates = Candidate.get_candidates_by_status('all', sort_param='department,-last_name')
+        self.assertEqual([cand.id for cand in sorted_candidates], [c2.id, c.id, c3.id])
+        #invalid keys get the default ordering
+        sorted_candidates = Candidate.get_candidates_by_status('all', sort_param='--title,-bogus')
+        self.assertEqual([cand.id for cand in sorted_candidates], [c3.id, c.id, c2.id])
+
+    def test_candidates_page(self):
+        dept2 = Department.objects.create(name='Anthropology')
+        candidates = []
+        for i in range(7):
+            p = Person.objects.create(netid='person%s@brown.edu' % i, last_name='Smith', email='person%s@brown.edu' % i)
+            c = Candidate.objects.create(person=p, year=2016, department=self.dept if i % 2 else dept2, degree=self.degree)
+            if i % 3:
+                c.thesis.date_submitted = timezone.now()
+                c.thesis.save()
+            candidates.append(c)
+        for sort_param in [None, 'department', '-department,date_submitted', 'date_submitted', '-date_submitted,-id']:
+            all_ids = [c.id for c in Candidate.get_candidates_by_status('all', sort_param=sort_param)]
+            self.assertEqual(len(all_ids), 7)
+            for page_size in [1, 2, 3, 7, 10]:
+                self.assertEqual(self._page_through('all', sort_param, page_size), all_ids, '%s %s' % (sort_param, page_size))
+        page, next_after = Candidate.get_candidates_page('all', page_size=10)
+        self.assertEqual(len(page), 7)
+        self.assertEqual(next_after, None)
+        with self.assertRaises(CandidateException):
+            Candidate.get_candidates_page('all', after=12345)
+
+
+class TestCandidateSearch(TestCase):
+
+    def setUp(self):
+        self.dept = Department.objects.create(name='Engineering')
+        self.dept2 = Department.objects.create(name='Anthropology')
+        self.degree = Degree.objects.create(abbreviation='Ph.D', name='Doctor of Philosophy')
+        p = Person.objects.create(netid='tjones@brown.edu', last_name='Jones', first_name='Tom', email='tom_jones@brown.edu')
+        p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='Smith', first_name='Jon', email='r_smith@brown.edu')
+        p3 = Person.objects.create(netid='jsmith@brown.edu', last_name='Jonson', first_name='Sam', email='sam@brown.edu')
+        self.c = Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        self.c2 = Candidate.objects.create(person=p2, year=2016, department=self.dept2, degree=self.degree)
+        self.c3 = Candidate.objects.create(person=p3, year=2016, department=self.dept, degree=self.degree)
+        self.c2.thesis.title = 'Engines of Change'
+        self.c2.thesis.save()
+        self.c3.thesis.title = 'A study of anthropology'
+        self.c3.thesis.save()
+
+    def test_search_ranked(self):
+        results, next_after = Candidate.search('jon')
+        #exact last name, then last name prefix, then first name
+        self.assertEqual([c.id for c in results], [self.c.id, self.c3.id, self.c2.id])
+        self.assertEqual(next_after, None)
+        results, next_after = Candidate.search('Jones')
+        self.assertEqual([c.id for c in results], [self.c.id])
+
+    def test_search_fields(self):
+        self.assertEqual([c.id for c in Candidate.search('rsmith@brown.edu')[0]], [self.c2.id])
+        self.assertEqual([c.id for c in Candidate.search('SAM@')[0]], [self.c3.id])
+        #title matches rank ahead of department matches
+        self.assertEqual([c.id for c in Candidate.search('eng')[0]], [self.c2.id, self.c.id, self.c3.id])
+        #only the start of the title is matched
+        self.assertEqual([c.id for c in Candidate.search('anthro')[0]], [self.c2.id])
+        self.assertEqual(Candidate.search('change')[0], [])
+        #every word has to match
+        self.assertEqual([c.id for c in Candidate.search('jon engineering')[0]], [self.c.id, self.c3.id])
+        self.assertEqual(Candidate.search('  ')[0], [])
+        self.assertEqual(Candidate.search('zzz')[0], [])
+
+    def test_search_paged(self):
+        results, next_after = Candidate.search('jon', page_size=2)
+        self.assertEqual([c.id for c in results], [self.c.id, self.c3.id])
+        self.assertEqual(next_after, self.c3.id)
+        results, next_after = Candidate.search('jon', after=next_after, page_size=2)
+        self.assertEqual([c.id for c in results], [self.c2.id])
+        self.assertEqual(next_after, None)
+
+
+class TestCandidateSummary(TestCase):
+
+    def setUp(self):
+        self.dept = Department.objects.create(name='Engineering')
+        self.degree = Degree.objects.create(abbreviation='Ph.D', name='Doctor of Philosophy')
+        self.person = Person.objects.create(netid='tjones@brown.edu', last_name=LAST_NAME, first_name=FIRST_NAME, email='tom_jones@brown.edu')
+        self.candidate = Candidate.objects.create(person=self.person, year=2016, department=self.dept, degree=self.degree)
+
+    def test_summary_kept_up_to_date(self):
+        summary = CandidateSummary.objects.get(candidate=self.candidate)
+        self.assertEqual(summary.workflow_status, CandidateSummary.WORKFLOW_STATUSES.in_progress)
+        self.assertEqual(summary.last_name, LAST_NAME)
+        self.assertEqual(summary.department_name, 'Engineering')
+        thesis = self.candidate.thesis
+        thesis.title = 'tëst'
+        thesis.status = Thesis.STATUS_CHOICES.pending
+        thesis.save()
+        summary = CandidateSummary.objects.get(candidate=self.candidate)
+        self.assertEqual(summary.workflow_status, CandidateSummary.WORKFLOW_STATUSES.awaiting_gradschool)
+        self.assertEqual(summary.title, 'tëst')
+        thesis.status = Thesis.STATUS_CHOICES.accepted
+        thesis.save()
+        self.assertEqual(CandidateSummary.objects.get(candidate=self.candidate).workflow_status,
+                         CandidateSummary.WORKFLOW_STATUSES.paperwork_incomplete)
+        complete_gradschool_checklist(self.candidate)
+        self.assertEqual(CandidateSummary.objects.get(candidate=self.candidate).workflow_status,
+                         CandidateSummary.WORKFLOW_STATUSES.complete)
+        thesis.mark_ingested('1234')
+        self.assertEqual(CandidateSummary.objects.get(candidate=self.candidate).workflow_status, '')
+        self.candidate.year = 2017
+        self.candidate.department = Department.objects.create(name='Anthropology')
+        self.candidate.save()
+        self.assertEqual(CandidateSummary.objects.get(candidate=self.candidate).department_name, 'Anthropology')
+        self.assertEqual(CandidateSummary.objects.count(), 1)
+
+    def test_rebuild(self):
+        masters = Degree.objects.create(abbreviation='MS', name='Masters', degree_type=Degree.TYPES.masters)
+        p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='smith', email='r_smith@brown.edu')
+        c2 = Candidate.objects.create(person=p2, year=2016, department=self.dept, degree=masters)
+        Thesis.objects.filter(candidate=c2).update(status=Thesis.STATUS_CHOICES.accepted, title='test')
+        GradschoolChecklist.objects.filter(candidate=c2).update(bursar_receipt=timezone.now(), pages_submitted_to_gradschool=timezone.now())
+        CandidateSummary.objects.all().delete()
+        call_command('rebuild_candidate_summaries', stdout=open(os.devnull, 'w'))
+        self.assertEqual(CandidateSummary.objects.count(), 2)
+        self.assertEqual(CandidateSummary.objects.get(candidate=self.candidate).workflow_status,
+                         CandidateSummary.WORKFLOW_STATUSES.in_progress)
+        summary = CandidateSummary.objects.get(candidate=c2)
+        self.assertEqual(summary.workflow_status, CandidateSummary.WORKFLOW_STATUSES.complete)
+        self.assertEqual(summary.title, 'test')
+        self.assertEqual(summary.last_name, 'smith')
+
+    def test_status_counts(self):
+        p2 = Person.objects.create(netid='rsmith@brown.edu', last_name='smith', email='r_smith@brown.edu')
+        c2 = Candidate.objects.create(person=p2, year=2016, department=self.dept, degree=self.degree)
+        c2.thesis.status = Thesis.STATUS_CHOICES.rejected
+        c2.thesis.save()
+        with self.assertNumQueries(1):
+            counts = CandidateSummary.get_status_counts()
+        self.assertEqual(counts['all'], 2)
+        self.assertEqual(counts['in_progress'], 1)
+        self.assertEqual(counts['dissertation_rejected'], 1)
+        self.assertEqual(counts['complete'], 0)
+
+
 class TestCommitteeMember(TestCase):
 
     def setUp(self):
@@ -372,6 +598,132 @@ class TestKeyword(TestCase):
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0].id, k2.id)
 
+    def test_get_or_create_all(self):
+        k1 = Keyword.objects.create(text=COMPOSED_TEXT)
+        keywords = Keyword.get_or_create_all([Keyword(text='new'), Keyword(text=COMPOSED_TEXT), Keyword(text='new')])
+        self.assertEqual(keywords[1].id, k1.id)
+        self.assertEqual(keywords[0].id, keywords[2].id)
+        self.assertEqual(keywords[0].search_text, 'new')
+        with self.assertRaises(KeywordException):
+            Keyword.get_or_create_all([Keyword(text='')])
+
+    def test_get_or_create_all_loose_collation(self):
+        #mysql collations can match 'Resume' to an existing 'Résumé', so it's found but not under its own text,
+        #  & creating it fails
+        existing = Keyword.objects.create(text='Résumé')
+        real_filter = Keyword.objects.filter
+        def loose_filter(*args, **kwargs):
+            if 'text__in' in kwargs:
+                texts = kwargs.pop('text__in')
+                kwargs['search_text__in'] = [Keyword.get_search_text(Keyword.normalize_text(t)) for t in texts]
+            return real_filter(*args, **kwargs)
+        def already_exists(*args, **kwargs):
+            raise IntegrityError('duplicate entry')
+        real_save = Keyword.save
+        Keyword.objects.filter = loose_filter
+        Keyword.objects.bulk_create = already_exists
+        Keyword.save = already_exists
+        try:
+            keywords = Keyword.get_or_create_all([Keyword(text='Resume'), Keyword(text='Résumé')])
+        finally:
+            del Keyword.objects.filter
+            del Keyword.objects.bulk_create
+            Keyword.save = real_save
+        self.assertEqual([k.id for k in keywords], [existing.id, existing.id])
+
+    def test_usage_counts(self):
+        k1 = Keyword.objects.create(text='one')
+        k2 = Keyword.objects.create(text='two')
+        thesis = Candidate.objects.create(person=Person.objects.create(netid='tjones@brown.edu', last_name='jones', email='tom_jones@brown.edu'),
+                department=Department.objects.create(name='Engineering'), degree=Degree.objects.create(abbreviation='PhD', name='Doctor'),
+                year=2016).thesis
+        thesis.keywords.add(k1, k2)
+        thesis.keywords.add(k1)
+        self.assertEqual(Keyword.objects.get(id=k1.id).usage_count, 1)
+        #removing a keyword that isn't there doesn't change its count
+        thesis.keywords.remove(k2)
+        thesis.keywords.remove(k2)
+        self.assertEqual(Keyword.objects.get(id=k2.id).usage_count, 0)
+        k2.thesis_set.add(thesis)
+        self.assertEqual(Keyword.objects.get(id=k2.id).usage_count, 1)
+        thesis.keywords.clear()
+        self.assertEqual(list(Keyword.objects.order_by('id').values_list('usage_count', flat=True)), [0, 0])
+        thesis.keywords.add(k2)
+        Keyword.objects.update(usage_count=5)
+        Keyword.rebuild_usage_counts()
+        self.assertEqual(list(Keyword.objects.order_by('id').values_list('usage_count', flat=True)), [0, 1])
+        self.assertEqual([k.id for k in Keyword.search('o', order='-usage_count', limit=1)], [k2.id])
+
+    def test_merge_duplicates(self):
+        free_text = Keyword.objects.create(text='climate-change')
+        fast_kw = Keyword.objects.create(text='Climate change', authority='fast')
+        other = Keyword.objects.create(text='Climate Change.')
+        Keyword.objects.create(text='climate')
+        degree = Degree.objects.create(abbreviation='PhD', name='Doctor')
+        dept = Department.objects.create(name='Engineering')
+        theses = []
+        for netid in ['one', 'two']:
+            person = Person.objects.create(netid=netid, last_name=netid, email='%s@brown.edu' % netid)
+            theses.append(Candidate.objects.create(person=person, department=dept, degree=degree, year=2016).thesis)
+        theses[0].keywords.add(free_text, other)
+        theses[1].keywords.add(free_text, fast_kw)
+        self.assertEqual([[k.id for k in cluster] for cluster in Keyword.find_duplicates()], [[fast_kw.id, free_text.id, other.id]])
+        #just lists them, without --merge
+        call_command('merge_duplicate_keywords', stdout=StringIO())
+        self.assertEqual(Keyword.objects.count(), 4)
+        call_command('merge_duplicate_keywords', merge=True, stdout=StringIO())
+        self.assertEqual(sorted(Keyword.objects.values_list('text', flat=True)), ['Climate change', 'climate'])
+        for thesis in theses:
+            self.assertEqual([k.id for k in thesis.keywords.all()], [fast_kw.id])
+        self.assertEqual(Keyword.objects.get(id=fast_kw.id).usage_count, 2)
+
+    def test_duplicate_key(self):
+        self.assertEqual(Keyword.get_duplicate_key('climate-change.'), 'climate change')
+        self.assertEqual(Keyword.get_duplicate_key('"climate  change"'), 'climate change')
+        self.assertEqual(len(set(Keyword.get_duplicate_key(text) for text in ['c++', 'c#', 'c', 'c.'])), 3)
+        self.assertNotEqual(Keyword.get_duplicate_key('women--employment'), Keyword.get_duplicate_key('women employment'))
+
+    def test_duplicates_not_merged(self):
+        Keyword.objects.create(text='C++')
+        Keyword.objects.create(text='C#')
+        Keyword.objects.create(text='C')
+        Keyword.objects.create(text='Women--Employment')
+        Keyword.objects.create(text='Women employment')
+        #near-duplicates that are different FAST headings
+        Keyword.objects.create(text='Mercury', authority='fast', value_uri='http://id.worldcat.org/fast/1')
+        Keyword.objects.create(text='Mercury.', authority='fast', value_uri='http://id.worldcat.org/fast/2')
+        Keyword.objects.create(text='mercury')
+        self.assertEqual(Keyword.find_duplicates(), [])
+
+    def test_suggest(self):
+        keyword_index.reset_index()
+        k1 = Keyword.objects.create(text='Réunion')
+        self.assertEqual(Keyword.suggest('reu'), [(k1.id, k1.text)])
+        #the loaded index is kept up-to-date on save & delete
+        k2 = Keyword.objects.create(text='reunions')
+        k1.text = 'Meeting'
+        k1.save()
+        self.assertEqual(Keyword.suggest('REU'), [(k2.id, 'reunions')])
+        k2.delete()
+        self.assertEqual(Keyword.suggest('reu'), [])
+        self.assertEqual(Keyword.suggest('meet'), [(k1.id, 'Meeting')])
+
+
+class TestFastSubject(TestCase):
+
+    def test_import_and_search(self):
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        call_command('import_fast_subjects', os.path.join(cur_dir, 'test_files', 'fast_subjects.nt'), batch_size=2, stdout=StringIO())
+        self.assertEqual(FastSubject.objects.count(), 5)
+        self.assertEqual(FastSubject.search('pyth'), [
+                ('fst01084736', 'Python (Computer program language)', 'Python (Computer program language)')])
+        self.assertEqual(FastSubject.search('reunion'), [('fst00940388', Keyword.normalize_text('Réunion'), Keyword.normalize_text('Réunion'))])
+        self.assertEqual(FastSubject.search('bourbon')[0][0], 'fst00940388')
+        self.assertEqual(FastSubject.search(' '), [])
+        #loading again replaces the old subjects
+        FastSubject.load([('fst1', 'Python', [])])
+        self.assertEqual(FastSubject.search('pyth'), [('fst1', 'Python', 'Python')])
+
 
 def add_file_to_thesis(thesis):
     cur_dir = os.path.dirname(os.path.abspath(__file__))
@@ -409,6 +761,27 @@ class TestThesis(TestCase):
             candidate2.thesis.save()
         self.assertTrue('pid' in cm.exception.message)
 
+    def test_checksums(self):
+        add_file_to_thesis(self.candidate.thesis)
+        thesis = Thesis.objects.get(id=self.candidate.thesis.id)
+        self.assertEqual(thesis.checksum, TEST_PDF_SHA1)
+        self.assertEqual(thesis.sha256, TEST_PDF_SHA256)
+        self.assertEqual(thesis.md5, TEST_PDF_MD5)
+
+    def test_update_keywords(self):
+        thesis = self.candidate.thesis
+        k1 = Keyword.objects.create(text='one')
+        k2 = Keyword.objects.create(text='two')
+        k3 = Keyword.objects.create(text='three')
+        thesis.update_keywords([k1, k2])
+        self.assertEqual(sorted(k.text for k in thesis.keywords.all()), ['one', 'two'])
+        #nothing changed, so there's just the query for the current keywords
+        with self.assertNumQueries(1):
+            thesis.update_keywords([k2, k1])
+        thesis.update_keywords([k2, k3])
+        self.assertEqual(sorted(k.text for k in thesis.keywords.all()), ['three', 'two'])
+        self.assertEqual(list(Keyword.objects.order_by('id').values_list('usage_count', flat=True)), [0, 1, 1])
+
     def test_multiple_theses_with_no_pid(self):
         candidate2 = Candidate.objects.create(person=self.person, year=2018, department=self.dept, degree=self.degree)
         candidate2.thesis.pid = ''
@@ -438,11 +811,91 @@ class TestThesis(TestCase):
         thesis = self.candidate.thesis
         add_file_to_thesis(thesis)
         self.assertEqual(thesis.original_file_name, 'test.pdf')
-        self.assertTrue(thesis.current_file_name.startswith('test'))
-        self.assertTrue(thesis.current_file_name.endswith('.pdf'))
+        self.assertEqual(thesis.current_file_name, '%s.pdf' % TEST_PDF_SHA1)
+        self.assertEqual(thesis.document.name, 'b1/93/%s.pdf' % TEST_PDF_SHA1)
+        self.assertEqual(thesis.file_path, Thesis._meta.get_field('document').storage.path(thesis.document.name))
         self.assertEqual(thesis.checksum, 'b1938fc5549d1b5b42c0b695baa76d5df5f81ac3')
         self.assertEqual(thesis.status, Thesis.STATUS_CHOICES.not_submitted)
 
+    def test_identical_files_stored_once(self):
+        add_file_to_thesis(self.candidate.thesis)
+        other_candidate = Candidate.objects.create(person=self.person, year=2018, department=self.dept, degree=self.degree)
+        add_file_to_thesis(other_candidate.thesis)
+        self.assertEqual(other_candidate.thesis.document.name, self.candidate.thesis.document.name)
+        self.assertEqual(os.listdir(os.path.dirname(self.candidate.thesis.file_path)), [self.candidate.thesis.current_file_name])
+
+    def test_orphaned_files(self):
+        thesis = self.candidate.thesis
+        add_file_to_thesis(thesis)
+        #make the thesis file old enough to be deleted, if it were an orphan
+        old_time = time.time() - 2 * 60 * 60
+        os.utime(thesis.file_path, (old_time, old_time))
+        old_orphan = os.path.join(settings.MEDIA_ROOT, 'ab', 'cd', 'abcd_old_orphan.pdf')
+        new_orphan = os.path.join(settings.MEDIA_ROOT, 'ab', 'cd', 'abcd_new_orphan.pdf')
+        if not os.path.exists(os.path.dirname(old_orphan)):
+            os.makedirs(os.path.dirname(old_orphan))
+        for path in [old_orphan, new_orphan]:
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-')
+        os.utime(old_orphan, (old_time, old_time))
+        orphans = Thesis.find_orphaned_files(grace_period=60 * 60)
+        self.assertIn(os.path.join('ab', 'cd', 'abcd_old_orphan.pdf'), orphans)
+        self.assertNotIn(os.path.join('ab', 'cd', 'abcd_new_orphan.pdf'), orphans)
+        self.assertNotIn(thesis.document.name, orphans)
+        deleted = Thesis.delete_orphaned_files(grace_period=60 * 60, workers=2)
+        self.assertIn(os.path.join('ab', 'cd', 'abcd_old_orphan.pdf'), deleted)
+        self.assertFalse(os.path.exists(old_orphan))
+        self.assertTrue(os.path.exists(new_orphan))
+        self.assertTrue(os.path.exists(thesis.file_path))
+        os.remove(new_orphan)
+
+    def test_fixity_check(self):
+        thesis = self.candidate.thesis
+        add_file_to_thesis(thesis)
+        other_candidate = Candidate.objects.create(person=self.person, year=2018, department=self.dept, degree=self.degree)
+        add_file_to_thesis(other_candidate.thesis)
+        Thesis.objects.filter(id=other_candidate.thesis.id).update(checksum='0' * 40)
+        results = FixityCheck.run()
+        self.assertEqual(sorted([(r.thesis_id, r.passed) for r in results]), [(thesis.id, True), (other_candidate.thesis.id, False)])
+        failure = FixityCheck.objects.get(passed=False)
+        self.assertEqual(failure.found_checksum, TEST_PDF_SHA1)
+        self.assertEqual(failure.expected_checksum, '0' * 40)
+        #next time, the thesis that was checked longest ago comes first
+        FixityCheck.objects.filter(thesis=thesis).update(checked=timezone.now() - timedelta(days=1))
+        self.assertEqual([row[0] for row in FixityCheck.get_theses_to_check()], [thesis.id, other_candidate.thesis.id])
+        self.assertEqual(FixityCheck.run(limit=1)[0].thesis_id, thesis.id)
+        self.assertEqual(FixityCheck.objects.count(), 3)
+
+    def test_move_files_to_content_addressed_storage(self):
+        document_storage = Thesis._meta.get_field('document').storage
+        thesis = self.candidate.thesis
+        add_file_to_thesis(thesis)
+        other_candidate = Candidate.objects.create(person=self.person, year=2018, department=self.dept, degree=self.degree)
+        add_file_to_thesis(other_candidate.thesis)
+        #put the files back where they used to be stored, by their upload names
+        with open(thesis.file_path, 'rb') as f:
+            pdf_data = f.read()
+        for old_name in ['test_old.pdf', 'test_old_2.pdf']:
+            with open(document_storage.path(old_name), 'wb') as f:
+                f.write(pdf_data)
+        os.remove(thesis.file_path)
+        Thesis.objects.filter(id=thesis.id).update(document='test_old.pdf', checksum='')
+        Thesis.objects.filter(id=other_candidate.thesis.id).update(document='test_old_2.pdf')
+        new_name = 'b1/93/%s.pdf' % TEST_PDF_SHA1
+        self.assertEqual(Thesis.move_files_to_content_addressed_storage(dry_run=True),
+                [('test_old.pdf', new_name), ('test_old_2.pdf', new_name)])
+        self.assertTrue(document_storage.exists('test_old.pdf'))
+        with self.assertNumQueries(3):
+            Thesis.move_files_to_content_addressed_storage()
+        for thesis in Thesis.objects.filter(id__in=[thesis.id, other_candidate.thesis.id]):
+            self.assertEqual(thesis.document.name, new_name)
+            self.assertEqual(thesis.checksum, TEST_PDF_SHA1)
+        self.assertTrue(document_storage.exists(new_name))
+        #the identical copy is removed too
+        self.assertFalse(document_storage.exists('test_old.pdf'))
+        self.assertFalse(document_storage.exists('test_old_2.pdf'))
+        self.assertEqual(Thesis.move_files_to_content_addressed_storage(), [])
+
     def test_invalid_file(self):
         with open(os.path.join(self.cur_dir, 'test_files', 'test_obj'), 'rb') as f:
             bad_file = File(f)
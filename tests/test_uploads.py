@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import io
+import time
+from datetime import timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.http import HttpRequest
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from etd_app import uploads
+from etd_app.forms import UploadForm, pdf_validator
+from etd_app.models import Person, Department, Degree, Candidate, UploadSession
+from etd_app.uploads import ThesisUploadHandler
+from tests.test_checksums import TEST_PDF_SHA1, TEST_PDF_SHA256, TEST_PDF_MD5
+import os
+
+
+class TestThesisUploadHandler(SimpleTestCase):
+
+    def _upload(self, data, chunk_size=1000, content_length=None):
+        self.request = HttpRequest()
+        handler = ThesisUploadHandler(self.request)
+        handler.new_file('thesis_file', 'thesis.pdf', 'application/pdf', content_length)
+        for start in range(0, len(data), chunk_size):
+            handler.receive_data_chunk(data[start:start + chunk_size], start)
+        return handler.file_complete(len(data))
+
+    def test_pdf(self):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files', 'test.pdf'), 'rb') as f:
+            data = f.read()
+        uploaded_file = self._upload(data, chunk_size=3)
+        self.assertEqual(uploaded_file.upload_error, None)
+        self.assertEqual(uploaded_file.digests, {'sha1': TEST_PDF_SHA1, 'sha256': TEST_PDF_SHA256, 'md5': TEST_PDF_MD5})
+        self.assertEqual(uploaded_file.read(), data)
+        pdf_validator(uploaded_file)
+
+    def test_not_pdf(self):
+        #the upload is stopped at the first chunk
+        with self.assertRaises(StopUpload) as cm:
+            self._upload(b'<html>' * 1000)
+        self.assertTrue(cm.exception.connection_reset)
+        self.assertEqual(self.request.upload_error, 'file must be a PDF')
+        self.assertEqual(self._upload(b'%PD').upload_error, 'file must be a PDF')
+
+    def test_too_large(self):
+        with self.settings(THESIS_MAX_UPLOAD_SIZE=2 * 1024 * 1024):
+            with self.assertRaises(StopUpload):
+                self._upload(b'%PDF-' + b'0' * 3 * 1024 * 1024, chunk_size=64 * 1024)
+            self.assertEqual(self.request.upload_error, 'file is too large (the limit is 2 MB)')
+            #if the request says how big the file is, it's rejected right away
+            with self.assertRaises(StopUpload):
+                self._upload(b'', content_length=3 * 1024 * 1024)
+            self.assertEqual(self.request.upload_error, 'file is too large (the limit is 2 MB)')
+
+    def test_form_gets_error(self):
+        request = RequestFactory().post('/', {'thesis_file': SimpleUploadedFile('thesis.pdf', b'<html>' * 1000)})
+        request.upload_handlers = [ThesisUploadHandler(request)]
+        self.assertEqual(len(request.FILES), 0)
+        form = UploadForm(request.POST, request.FILES, upload_error=request.upload_error)
+        self.assertEqual(form.errors['thesis_file'], ['file must be a PDF'])
+        #other forms still say the file is required
+        self.assertEqual(UploadForm({}, {}).errors['thesis_file'], ['This field is required.'])
+
+
+class TestExpiredUploadSessions(TestCase):
+
+    def setUp(self):
+        person = Person.objects.create(netid='tjones@brown.edu', last_name='Jones', email='tom_jones@brown.edu')
+        self.candidate = Candidate.objects.create(person=person, year=2016, degree=Degree.objects.create(abbreviation='PhD', name='Doctor'),
+                department=Department.objects.create(name='Engineering'))
+
+    def test_delete_expired_upload_sessions(self):
+        expired = uploads.start_upload_session(self.candidate, 'old.pdf', 100)
+        uploads.append_chunk(expired, io.BytesIO(b'%PDF-'), 0)
+        current = uploads.start_upload_session(self.candidate, 'new.pdf', 100)
+        UploadSession.objects.filter(id=expired.id).update(modified=timezone.now() - timedelta(hours=2))
+        stray_path = os.path.join(UploadSession.get_upload_dir(), 'stray')
+        io.open(stray_path, 'wb').close()
+        two_hours_ago = time.time() - 2 * 60 * 60
+        os.utime(stray_path, (two_hours_ago, two_hours_ago))
+        self.assertEqual(uploads.delete_expired_upload_sessions(expiry=60 * 60), (1, 1))
+        self.assertEqual(list(UploadSession.objects.values_list('id', flat=True)), [current.id])
+        self.assertFalse(os.path.exists(expired.path))
+        self.assertFalse(os.path.exists(stray_path))
+        self.assertTrue(os.path.exists(current.path))
+        self.assertNotIn(expired.id, uploads._calculators)
+        uploads.discard_upload_session(current)
+
+    def test_chunk_updates_modified(self):
+        upload_session = uploads.start_upload_session(self.candidate, 'thesis.pdf', 100)
+        UploadSession.objects.filter(id=upload_session.id).update(modified=timezone.now() - timedelta(hours=2))
+        uploads.append_chunk(upload_session, io.BytesIO(b'%PDF-'), 0)
+        self.assertEqual(uploads.delete_expired_upload_sessions(expiry=60 * 60)[0], 0)
+        uploads.discard_upload_session(upload_session)
+
+
+class TestAppendChunk(TestCase):
+
+    def setUp(self):
+        person = Person.objects.create(netid='tjones@brown.edu', last_name='Jones', email='tom_jones@brown.edu')
+        candidate = Candidate.objects.create(person=person, year=2016, degree=Degree.objects.create(abbreviation='PhD', name='Doctor'),
+                department=Department.objects.create(name='Engineering'))
+        self.upload_session = uploads.start_upload_session(candidate, 'thesis.pdf', 100)
+
+    def tearDown(self):
+        uploads.discard_upload_session(self.upload_session)
+
+    def test_stale_session(self):
+        #another request added a chunk after this copy of the session was loaded
+        stale = UploadSession.objects.get(id=self.upload_session.id)
+        uploads.append_chunk(self.upload_session, io.BytesIO(b'%PDF-1.4'), 0)
+        with self.assertRaises(uploads.UploadSessionException):
+            uploads.append_chunk(stale, io.BytesIO(b'%PDF-'), 0)
+        self.assertEqual(stale.offset, 8)
+        with io.open(self.upload_session.path, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4')
+        uploads.append_chunk(stale, io.BytesIO(b'abc'), 8)
+        self.assertEqual(UploadSession.objects.get(id=self.upload_session.id).offset, 11)
+
+    def test_offset_changed_while_writing(self):
+        upload_session = self.upload_session
+
+        class Stream(object):
+            def __init__(self):
+                self.chunks = [b'%PDF-', b'']
+            def read(self, size):
+                UploadSession.objects.filter(id=upload_session.id).update(offset=3)
+                return self.chunks.pop(0)
+
+        with self.assertRaises(uploads.UploadSessionException):
+            uploads.append_chunk(upload_session, Stream(), 0)
+        self.assertEqual(UploadSession.objects.get(id=upload_session.id).offset, 3)
+        self.assertNotIn(upload_session.id, uploads._calculators)
@@ -2,18 +2,27 @@
 from __future__ import unicode_literals
 import json
 import os
+import shutil
+import tempfile
+import threading
+import time
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
 from django.core.files import File
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.http import HttpRequest
+from django.db import connection
 from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from tests.test_client import ETDTestClient
 from tests.test_models import LAST_NAME, FIRST_NAME, add_file_to_thesis, add_metadata_to_thesis
-from etd_app.models import Person, Candidate, CommitteeMember, Department, Degree, Thesis, Keyword
-from etd_app.views import get_shib_info_from_request, _get_previously_used, _get_fast_results
+from etd_app.models import Person, Candidate, CommitteeMember, Department, Degree, Thesis, Keyword, FastSubject, UploadSession
+from etd_app.views import (get_shib_info_from_request, _get_previously_used, _get_fast_results, _merge_fast_results,
+        _finish_fast_lookups, FAST_ERROR_RESPONSE)
 from etd_app.widgets import ID_VAL_SEPARATOR
+from etd_app import fast, keyword_index
 
 
 def get_auth_client():
@@ -385,6 +394,79 @@ class TestCandidateUpload(TestCase, CandidateCreator):
             thesis = Candidate.objects.all()[0].thesis
             self.assertEqual(thesis.original_file_name, 'test2.pdf')
             self.assertEqual(thesis.checksum, '2ce252ec827258837e53b2b0bfb94141ba951f2e')
+            self.assertEqual(len(thesis.sha256), 64)
+
+
+class TestCandidateChunkedUpload(TestCase, CandidateCreator):
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.settings_override = self.settings(THESIS_UPLOAD_SESSION_DIR=self.upload_dir)
+        self.settings_override.enable()
+        with open(os.path.join(self.cur_dir, 'test_files', 'test.pdf'), 'rb') as f:
+            self.pdf_data = f.read()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.upload_dir)
+
+    def _start(self, auth_client, size=None, file_name='thesis.pdf'):
+        response = auth_client.post(reverse('candidate_upload_start'), {'file_name': file_name, 'size': size or len(self.pdf_data)})
+        return response, json.loads(response.content)
+
+    def _put(self, auth_client, upload_id, data, offset):
+        return auth_client.put(reverse('candidate_upload_session', kwargs={'upload_id': upload_id}), data,
+                content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunked_upload(self):
+        self._create_candidate()
+        auth_client = get_auth_client()
+        response, upload = self._start(auth_client)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(upload['offset'], 0)
+        upload_id = upload['id']
+        response = self._put(auth_client, upload_id, self.pdf_data[:1000], 0)
+        self.assertEqual(json.loads(response.content)['offset'], 1000)
+        #a chunk at the wrong offset (eg. re-sending after a dropped connection) gets the current status back
+        response = self._put(auth_client, upload_id, self.pdf_data[:1000], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['offset'], 1000)
+        response = auth_client.get(reverse('candidate_upload_session', kwargs={'upload_id': upload_id}))
+        self.assertEqual(json.loads(response.content)['complete'], False)
+        response = auth_client.post(reverse('candidate_upload_finish', kwargs={'upload_id': upload_id}))
+        self.assertEqual(response.status_code, 400)
+        response = self._put(auth_client, upload_id, self.pdf_data[1000:], 1000)
+        self.assertEqual(json.loads(response.content)['complete'], True)
+        response = auth_client.post(reverse('candidate_upload_finish', kwargs={'upload_id': upload_id}))
+        self.assertEqual(json.loads(response.content), {'redirect': reverse('candidate_home')})
+        thesis = Candidate.objects.get(id=self.candidate.id).thesis
+        self.assertEqual(thesis.original_file_name, 'thesis.pdf')
+        self.assertEqual(thesis.checksum, 'b1938fc5549d1b5b42c0b695baa76d5df5f81ac3')
+        self.assertEqual(UploadSession.objects.count(), 0)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_bad_uploads(self):
+        self._create_candidate()
+        auth_client = get_auth_client()
+        response, upload = self._start(auth_client, file_name='thesis.doc')
+        self.assertEqual(upload['error'], 'file must be a PDF')
+        with self.settings(THESIS_MAX_UPLOAD_SIZE=1024 * 1024):
+            response, upload = self._start(auth_client, size=2 * 1024 * 1024)
+            self.assertEqual(upload['error'], 'file is too large (the limit is 1 MB)')
+        response, upload = self._start(auth_client)
+        response = self._put(auth_client, upload['id'], b'<html>', 0)
+        self.assertEqual(json.loads(response.content)['error'], 'file must be a PDF')
+        response = self._put(auth_client, upload['id'], self.pdf_data + b'extra', 6)
+        self.assertEqual(json.loads(response.content)['error'], 'chunk goes past the end of the file')
+
+    def test_other_users_upload(self):
+        self._create_candidate()
+        other_person = Person.objects.create(netid='rsmith@brown.edu', last_name='Smith', email='rsmith@brown.edu')
+        other_candidate = Candidate.objects.create(person=other_person, year=2016, department=self.dept, degree=self.degree)
+        upload_session = UploadSession.objects.create(candidate=other_candidate, file_name='thesis.pdf', size=100)
+        auth_client = get_auth_client()
+        response = auth_client.get(reverse('candidate_upload_session', kwargs={'upload_id': upload_session.id.hex}))
+        self.assertEqual(response.status_code, 404)
 
 
 class TestCandidateMetadata(TestCase, CandidateCreator):
@@ -425,6 +507,21 @@ class TestCandidateMetadata(TestCase, CandidateCreator):
         self.assertEqual(len(Thesis.objects.all()), 1)
         self.assertEqual(Candidate.objects.all()[0].thesis.title, 'tëst')
 
+    def test_metadata_post_keywords_unchanged(self):
+        self._create_candidate()
+        auth_client = get_auth_client()
+        k = Keyword.objects.create(text='tëst')
+        data = {'title': 'tëst', 'abstract': 'tëst abstract', 'keywords': k.id}
+        auth_client.post(reverse('candidate_metadata'), data)
+        #saving again doesn't touch the thesis keywords
+        with CaptureQueriesContext(connection) as queries:
+            response = auth_client.post(reverse('candidate_metadata'), data)
+        self.assertEqual(response.status_code, 302)
+        keyword_writes = [q['sql'] for q in queries.captured_queries
+                if 'thesis_keywords' in q['sql'] and ('INSERT' in q['sql'] or 'DELETE' in q['sql'])]
+        self.assertEqual(keyword_writes, [])
+        self.assertEqual([kw.id for kw in Candidate.objects.all()[0].thesis.keywords.all()], [k.id])
+
     def test_metadata_post_bad_encoding(self):
         #try passing non-utf8 data and see what happens. Gets saved to the db as unicode, but it's garbled
         self._create_candidate()
@@ -558,6 +655,21 @@ class TestStaffReview(TestCase, CandidateCreator):
         response = staff_client.get(reverse('review_candidates', kwargs={'status': 'complete'}))
         self.assertEqual(response.status_code, 200)
 
+    def test_view_candidates_query_count(self):
+        #the number of queries for the page shouldn't grow with the number of candidates
+        self._create_candidate()
+        staff_client = get_staff_client()
+        url = reverse('review_candidates', kwargs={'status': 'all'})
+        with CaptureQueriesContext(connection) as one_candidate:
+            response = staff_client.get(url)
+        for i in range(3):
+            p = Person.objects.create(netid='person%s@brown.edu' % i, last_name='smith%s' % i, email='person%s@brown.edu' % i)
+            Candidate.objects.create(person=p, year=2016, department=self.dept, degree=self.degree)
+        with CaptureQueriesContext(connection) as four_candidates:
+            response = staff_client.get(url)
+        self.assertContains(response, 'smith2')
+        self.assertEqual(len(one_candidate.captured_queries), len(four_candidates.captured_queries))
+
     def test_view_candidates_sorted(self):
         self._create_candidate()
         p = Person.objects.create(netid='rsmith@brown.edu', last_name='smith', email='r_smith@brown.edu')
@@ -568,6 +680,106 @@ class TestStaffReview(TestCase, CandidateCreator):
         self.assertEqual(response.status_code, 200)
         #tests passing in the sort_by param, but not really sure how to completely verify result
 
+    def test_view_candidates_paged(self):
+        self._create_candidate()
+        p = Person.objects.create(netid='rsmith@brown.edu', last_name='smith', email='r_smith@brown.edu')
+        c = Candidate.objects.create(person=p, department=self.dept, year=2016, degree=self.degree)
+        staff_client = get_staff_client()
+        url = reverse('review_candidates', kwargs={'status': 'all'})
+        response = staff_client.get('%s?sort_by=department,-last_name&page_size=1' % url)
+        self.assertContains(response, 'smith')
+        self.assertNotContains(response, LAST_NAME)
+        self.assertContains(response, 'after=%s' % c.id)
+        response = staff_client.get('%s?sort_by=department,-last_name&page_size=1&after=%s' % (url, c.id))
+        self.assertContains(response, LAST_NAME)
+        self.assertContains(response, 'First page')
+        self.assertNotContains(response, 'Next page')
+        response = staff_client.get('%s?page_size=abc' % url)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestStaffStatusCounts(TestCase, CandidateCreator):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_permission_required(self):
+        auth_client = get_auth_client()
+        response = auth_client.get(reverse('review_status_counts'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_status_counts(self):
+        self._create_candidate()
+        staff_client = get_staff_client()
+        response = staff_client.get(reverse('review_status_counts'))
+        counts = json.loads(response.content)
+        self.assertEqual(counts['all'], 1)
+        self.assertEqual(counts['in_progress'], 1)
+        self.assertEqual(counts['awaiting_gradschool'], 0)
+        #same counts - served from the cache, and the client's copy is still good
+        with CaptureQueriesContext(connection) as queries:
+            response = staff_client.get(reverse('review_status_counts'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries if 'candidatesummary' in q['sql']])
+        #changing the thesis clears the cache, so the counts & etag change
+        add_file_to_thesis(self.candidate.thesis)
+        add_metadata_to_thesis(self.candidate.thesis)
+        self.candidate.committee_members.add(self.committee_member)
+        self.candidate.thesis.submit()
+        response = staff_client.get(reverse('review_status_counts'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        counts = json.loads(response.content)
+        self.assertEqual(counts['in_progress'], 0)
+        self.assertEqual(counts['awaiting_gradschool'], 1)
+
+    def test_status_counts_in_page(self):
+        self._create_candidate()
+        staff_client = get_staff_client()
+        response = staff_client.get(reverse('review_candidates', kwargs={'status': 'all'}))
+        self.assertContains(response, 'ALL candidates <span class="badge">1</span>')
+
+
+class TestStaffExport(TestCase, CandidateCreator):
+
+    def test_permission_required(self):
+        auth_client = get_auth_client()
+        response = auth_client.get(reverse('review_export', kwargs={'status': 'all'}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export(self):
+        self._create_candidate()
+        staff_client = get_staff_client()
+        response = staff_client.get(reverse('review_export', kwargs={'status': 'all'}))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="candidates_all.csv"')
+        content = b''.join(response.streaming_content).decode('utf8')
+        self.assertTrue(content.startswith('candidate_id,netid,'))
+        self.assertTrue(LAST_NAME in content)
+        response = staff_client.get('%s?format=json' % reverse('review_export', kwargs={'status': 'in_progress'}))
+        data = json.loads(b''.join(response.streaming_content).decode('utf8'))
+        self.assertEqual(data[0]['netid'], 'tjones@brown.edu')
+        response = staff_client.get('%s?format=xml' % reverse('review_export', kwargs={'status': 'all'}))
+        self.assertEqual(response.status_code, 400)
+
+
+class TestStaffSearch(TestCase, CandidateCreator):
+
+    def test_permission_required(self):
+        auth_client = get_auth_client()
+        response = auth_client.get('%s?q=jones' % reverse('review_search'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_search(self):
+        self._create_candidate()
+        self.candidate.thesis.title = 'tëst title'
+        self.candidate.thesis.save()
+        staff_client = get_staff_client()
+        response = staff_client.get('%s?q=engineer' % reverse('review_search'))
+        self.assertContains(response, '%s, %s' % (LAST_NAME, FIRST_NAME))
+        self.assertContains(response, 'tëst title')
+        response = staff_client.get('%s?q=nobody' % reverse('review_search'))
+        self.assertContains(response, 'No candidates found')
+
 
 class TestStaffApproveThesis(TestCase, CandidateCreator):
 
@@ -672,9 +884,77 @@ class TestViewInfo(TestCase, CandidateCreator):
         response = auth_client.get(reverse('view_file', kwargs={'candidate_id': self.candidate.id}))
         self.assertEqual(response.status_code, 200)
 
+    def test_view_file_web_server(self):
+        self._create_candidate()
+        add_file_to_thesis(self.candidate.thesis)
+        file_name = self.candidate.thesis.document.name
+        auth_client = get_auth_client()
+        url = reverse('view_file', kwargs={'candidate_id': self.candidate.id})
+        with self.settings(THESIS_FILE_SERVING='nginx', THESIS_ACCEL_REDIRECT_PREFIX='/internal/'):
+            response = auth_client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/%s' % file_name)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="test.pdf"')
+        self.assertEqual(response.content, b'')
+        with self.settings(THESIS_FILE_SERVING='apache'):
+            response = auth_client.get(url)
+        self.assertEqual(response['X-Sendfile'], self.candidate.thesis.file_path)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_view_file_conditional(self):
+        self._create_candidate()
+        add_file_to_thesis(self.candidate.thesis)
+        thesis = Thesis.objects.get(id=self.candidate.thesis.id)
+        auth_client = get_auth_client()
+        url = reverse('view_file', kwargs={'candidate_id': self.candidate.id})
+        response = auth_client.get(url)
+        self.assertEqual(response['ETag'], '"%s"' % thesis.checksum)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        response = auth_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = auth_client.get(url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        response = auth_client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_view_file_ranges(self):
+        self._create_candidate()
+        add_file_to_thesis(self.candidate.thesis)
+        with open(os.path.join(self.cur_dir, 'test_files', 'test.pdf'), 'rb') as f:
+            pdf_data = f.read()
+        size = len(pdf_data)
+        auth_client = get_auth_client()
+        url = reverse('view_file', kwargs={'candidate_id': self.candidate.id})
+        response = auth_client.get(url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-99/%s' % size)
+        self.assertEqual(b''.join(response.streaming_content), pdf_data[:100])
+        response = auth_client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), pdf_data[-10:])
+        #overlapping ranges are merged
+        response = auth_client.get(url, HTTP_RANGE='bytes=0-9,5-19,100-109')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        content = b''.join(response.streaming_content)
+        self.assertEqual(len(content), int(response['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 0-19/%d\r\n\r\n%s\r\n' % (size, pdf_data[:20]), content)
+        self.assertIn(b'Content-Range: bytes 100-109/%d\r\n\r\n%s\r\n' % (size, pdf_data[100:110]), content)
+        response = auth_client.get(url, HTTP_RANGE='bytes=%s-' % size)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%s' % size)
+        #a stale If-Range gets the whole file
+        response = auth_client.get(url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), size)
+
 
 class TestAutocompleteKeywords(TestCase):
 
+    def setUp(self):
+        fast.get_results_cache().clear()
+        fast.reset_client()
+        keyword_index.reset_index()
+
     def test_login(self):
         response = self.client.get(reverse('autocomplete_keywords'))
         self.assertRedirects(response, '%s/?next=/autocomplete/keywords/' % settings.LOGIN_URL, fetch_redirect_response=False)
@@ -699,13 +979,78 @@ class TestAutocompleteKeywords(TestCase):
         #test no fast results
         fast_results = _get_fast_results('python01234')
         self.assertEqual(fast_results, [])
-        #now test fast error
+        #now test fast error (clearing the cached results first)
+        fast.get_results_cache().clear()
         with self.settings(FAST_LOOKUP_BASE_URL='http://localhost/fast'):
             fast_results = _get_fast_results('python')
             self.assertEqual(fast_results[0]['text'], 'FAST results')
             self.assertEqual(fast_results[0]['children'][0]['id'], '')
             self.assertEqual(fast_results[0]['children'][0]['text'], 'Error retrieving FAST results.')
 
+    def test_fast_lookup_cached(self):
+        cached_results = [{'text': 'FAST results', 'children': [{'id': 'fst1%stest' % ID_VAL_SEPARATOR, 'text': 'test'}]}]
+        fast.get_results_cache().set('Tëst ', 'suggestall', cached_results)
+        #FAST isn't reachable at this url, so the results have to come from the cache
+        with self.settings(FAST_LOOKUP_BASE_URL='http://localhost/fast'):
+            self.assertEqual(_get_fast_results('tëst'), cached_results)
+            #errors aren't cached
+            self.assertEqual(_get_fast_results('other')[0]['children'][0]['text'], 'Error retrieving FAST results.')
+            self.assertEqual(fast.get_results_cache().get('other', 'suggestall'), None)
+
+    def test_fast_circuit_open(self):
+        with self.settings(FAST_LOOKUP_BASE_URL='http://localhost/fast', FAST_CIRCUIT_FAILURE_THRESHOLD=2):
+            self.assertEqual(_get_fast_results('python'), FAST_ERROR_RESPONSE)
+            self.assertEqual(_get_fast_results('python'), FAST_ERROR_RESPONSE)
+            #now FAST is skipped, without showing the error
+            self.assertTrue(fast.get_client().is_open)
+            self.assertEqual(_get_fast_results('python'), [])
+
+    def test_autocomplete_keywords_local_authority(self):
+        FastSubject.load([('fst01084736', 'Python (Computer program language)', ['Python (Programming language)'])])
+        auth_client = get_auth_client()
+        #FAST isn't reachable, so the results have to come from the local table
+        with self.settings(FAST_LOOKUP_BASE_URL='http://localhost/fast', FAST_LOCAL_AUTHORITY=True):
+            response = auth_client.get('%s?term=python+(prog' % reverse('autocomplete_keywords'))
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['results'], [{'text': 'FAST results', 'children': [
+                {'id': 'fst01084736%sPython (Computer program language)' % ID_VAL_SEPARATOR,
+                 'text': 'Python (Computer program language) (Python (Programming language))'}]}])
+
+    def test_merge_fast_results(self):
+        suggestall = [{'text': 'FAST results', 'children': [
+                {'id': 'fst1%sClimate' % ID_VAL_SEPARATOR, 'text': 'Climate'},
+                {'id': 'fst2%sClimate change' % ID_VAL_SEPARATOR, 'text': 'Climate change'}]}]
+        suggest50 = [{'text': 'FAST results', 'children': [
+                {'id': 'fst2%sClimate change' % ID_VAL_SEPARATOR, 'text': 'Climate change'},
+                {'id': 'fst3%sClimatology' % ID_VAL_SEPARATOR, 'text': 'Climatology'}]}]
+        merged = _merge_fast_results([suggestall, FAST_ERROR_RESPONSE, suggest50, []])
+        self.assertEqual([r['text'] for r in merged[0]['children']], ['Climate', 'Climate change', 'Climatology'])
+        self.assertEqual(_merge_fast_results([[], FAST_ERROR_RESPONSE]), FAST_ERROR_RESPONSE)
+        self.assertEqual(_merge_fast_results([[], []]), [])
+
+    def test_fast_lookup_deadline(self):
+        finished = threading.Event()
+        slow_thread = threading.Thread(target=finished.wait, args=(5,))
+        slow_thread.start()
+        try:
+            start = time.time()
+            index_results = _finish_fast_lookups([('suggestall', slow_thread)], {}, time.time() + 0.1)
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(index_results, [FAST_ERROR_RESPONSE])
+        finally:
+            finished.set()
+
+    def test_autocomplete_keywords_multiple_indexes(self):
+        results_cache = fast.get_results_cache()
+        results_cache.set('clim', 'suggestall', [{'text': 'FAST results', 'children': [{'id': 'fst1%sClimate' % ID_VAL_SEPARATOR, 'text': 'Climate'}]}])
+        results_cache.set('clim', 'suggest50', [{'text': 'FAST results', 'children': [{'id': 'fst1%sClimate' % ID_VAL_SEPARATOR, 'text': 'Climate'}]}])
+        auth_client = get_auth_client()
+        with self.settings(FAST_LOOKUP_BASE_URL='http://localhost/fast', FAST_LOOKUP_INDEXES=['suggestall', 'suggest50', 'suggest55']):
+            response = auth_client.get('%s?term=clim' % reverse('autocomplete_keywords'))
+        response_data = json.loads(response.content)
+        #suggest55 errors, but the other indexes' results still come back
+        self.assertEqual(response_data['results'], [{'text': 'FAST results', 'children': [{'id': 'fst1%sClimate' % ID_VAL_SEPARATOR, 'text': 'Climate'}]}])
+
     def test_autocomplete_keywords(self):
         k = Keyword.objects.create(text='tëst')
         auth_client = get_auth_client()
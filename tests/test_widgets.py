@@ -2,7 +2,7 @@
 from __future__ import unicode_literals
 from django.http import QueryDict
 from django.test import TestCase
-from etd_app.models import Keyword
+from etd_app.models import Keyword, FastSubject
 from etd_app.widgets import KeywordSelect2TagWidget, ID_VAL_SEPARATOR, FAST_URI
 from .test_models import COMPOSED_TEXT, DECOMPOSED_TEXT
 
@@ -58,3 +58,34 @@ class TestKeywordTagWidget(TestCase):
         self.assertEqual(new_keyword.authority, 'fast')
         self.assertEqual(new_keyword.authority_uri, FAST_URI)
         self.assertEqual(new_keyword.value_uri, '%s/123456' % FAST_URI)
+
+    def test_fast_keyword_local_authority(self):
+        FastSubject.load([('fst01084736', 'Python (Computer program language)', [])])
+        post_string = 'keywords=fst01084736%sPython' % ID_VAL_SEPARATOR
+        widget = KeywordSelect2TagWidget()
+        with self.settings(FAST_LOCAL_AUTHORITY=True):
+            value_from_datadict = widget.value_from_datadict(QueryDict(post_string), {}, 'keywords')
+            #the heading comes from the local FAST table
+            new_keyword = Keyword.objects.get(id=value_from_datadict[0])
+            self.assertEqual(new_keyword.text, 'Python (Computer program language)')
+            self.assertEqual(new_keyword.value_uri, '%s/01084736' % FAST_URI)
+            self.assertEqual(widget.value_from_datadict(QueryDict(post_string), {}, 'keywords'), [new_keyword.id])
+
+    def test_many_keywords_constant_queries(self):
+        existing = Keyword.objects.create(text='existing')
+        values = [str(existing.id), COMPOSED_TEXT, 'fst123%sFast heading' % ID_VAL_SEPARATOR, 'dogs', 'dogs']
+        values.extend(['topic %s' % i for i in range(20)])
+        data = QueryDict('', mutable=True)
+        data.setlist('keywords', values)
+        widget = KeywordSelect2TagWidget()
+        with self.assertNumQueries(5):
+            value_from_datadict = widget.value_from_datadict(data, {}, 'keywords')
+        self.assertEqual(len(value_from_datadict), 25)
+        self.assertEqual(value_from_datadict[0], str(existing.id))
+        self.assertEqual(Keyword.objects.get(id=value_from_datadict[1]).text, DECOMPOSED_TEXT)
+        self.assertEqual(Keyword.objects.get(id=value_from_datadict[2]).authority, 'fast')
+        self.assertEqual(value_from_datadict[3], value_from_datadict[4])
+        self.assertEqual(Keyword.objects.count(), 24)
+        #submitting them again finds the keywords that are in the db now
+        with self.assertNumQueries(1):
+            self.assertEqual(widget.value_from_datadict(data, {}, 'keywords'), value_from_datadict)